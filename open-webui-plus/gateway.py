@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import aiohttp
+from asgiref.wsgi import WsgiToAsgi
+
+logger = logging.getLogger(__name__)
+
+# Headers that only apply to a single connection and are never forwarded
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade"
+}
+
+# Handshake headers aiohttp sets itself when opening an upstream WebSocket
+WEBSOCKET_HANDSHAKE = {
+    "sec-websocket-key", "sec-websocket-version", "sec-websocket-extensions",
+    "sec-websocket-protocol"
+}
+
+
+class Gateway:
+    """
+    Path-routing gateway, so one port (and one tunnel) serves everything.
+
+    Paths in local_paths are served by local_app, a Flask app, in process.
+    Paths starting with one of the routes' prefixes are proxied to that
+    route's upstream, and everything else to default. HTTP requests reuse
+    pooled keep-alive connections to the upstreams; WebSockets are proxied
+    on their own connection.
+    """
+
+    # Connections kept per upstream, and how long an idle one is kept.
+    # Idle connections are dropped before uvicorn's 5s keep-alive timeout,
+    # so a request is never sent down a connection the upstream is closing.
+    UPSTREAM_CONNECTIONS = 100
+    UPSTREAM_KEEPALIVE = 4
+    CONNECT_TIMEOUT = 10
+
+    def __init__(self, local_app, local_paths, routes, default):
+        self.local = WsgiToAsgi(local_app)
+        self.local_paths = set(local_paths)
+        self.routes = list(routes)
+        self.default = default
+        self.session = None
+
+    def upstream(self, path):
+        """Upstream URL for a path, None when it is served locally"""
+        if path in self.local_paths:
+            return None
+        for prefix, url in self.routes:
+            if path.startswith(prefix):
+                return url
+        return self.default
+
+    def get_session(self):
+        # Created on first use, inside the server's event loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.UPSTREAM_CONNECTIONS,
+                    keepalive_timeout=self.UPSTREAM_KEEPALIVE
+                ),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.CONNECT_TIMEOUT),
+                # Responses pass through as they are, cookies included
+                auto_decompress=False,
+                cookie_jar=aiohttp.DummyCookieJar()
+            )
+        return self.session
+
+    @staticmethod
+    def target(scope, upstream):
+        query = scope.get("query_string", b"").decode("latin-1")
+        path = scope.get("raw_path") or scope["path"].encode()
+        return f"{upstream}{path.decode('latin-1')}" + (f"?{query}" if query else "")
+
+    @staticmethod
+    def forward_headers(scope, skip=()):
+        """Request headers to send upstream, with X-Forwarded-* added"""
+        headers = []
+        forwarded_for = None
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").lower()
+            if name in HOP_BY_HOP or name in skip:
+                continue
+            if name == "x-forwarded-for":
+                forwarded_for = value.decode("latin-1")
+                continue
+            headers.append((name, value.decode("latin-1")))
+
+        client = (scope.get("client") or [None])[0]
+        if client:
+            forwarded_for = f"{forwarded_for}, {client}" if forwarded_for else client
+        if forwarded_for:
+            headers.append(("x-forwarded-for", forwarded_for))
+        if not any(name == "x-forwarded-proto" for name, _ in headers):
+            headers.append(("x-forwarded-proto", scope.get("scheme", "http").replace("ws", "http")))
+        return headers
+
+    async def proxy_http(self, scope, receive, send, upstream):
+        body_done = asyncio.Event()
+
+        async def body():
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    raise ConnectionResetError("Client disconnected")
+                if message.get("body"):
+                    yield message["body"]
+                more_body = message.get("more_body", False)
+            body_done.set()
+
+        headers = self.forward_headers(scope)
+        has_body = any(name.lower() in (b"content-length", b"transfer-encoding") for name, _ in scope["headers"])
+        if not has_body:
+            body_done.set()
+
+        try:
+            response = await self.get_session().request(
+                scope["method"],
+                self.target(scope, upstream),
+                headers=headers,
+                data=body() if has_body else None,
+                allow_redirects=False,
+                skip_auto_headers=("Accept-Encoding", "User-Agent", "Content-Type")
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            logger.error(f"Upstream {upstream} failed for {scope['path']}: {e}")
+            await send({
+                "type": "http.response.start",
+                "status": 502,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8")]
+            })
+            await send({"type": "http.response.body", "body": b"Bad gateway: the service is not available"})
+            return
+
+        async def relay():
+            await send({
+                "type": "http.response.start",
+                "status": response.status,
+                "headers": [
+                    (name, value) for name, value in response.raw_headers
+                    if name.decode("latin-1").lower() not in HOP_BY_HOP
+                ]
+            })
+            async for data in response.content.iter_any():
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            # The request body has been read, so the next message is the disconnect
+            await body_done.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # Stop reading a streaming response (SSE, audio) once the client is gone
+        relay_task = asyncio.ensure_future(relay())
+        watch_task = asyncio.ensure_future(disconnected())
+        try:
+            await asyncio.wait((relay_task, watch_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watch_task.cancel()
+            if not relay_task.done():
+                relay_task.cancel()
+                # The connection is mid-response and can't go back to the pool
+                response.close()
+            else:
+                response.release()
+        if relay_task.done() and not relay_task.cancelled() and relay_task.exception():
+            logger.error(f"Relaying {scope['path']} from {upstream} failed: {relay_task.exception()}")
+
+    async def proxy_websocket(self, scope, receive, send, upstream):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        try:
+            upstream_ws = await self.get_session().ws_connect(
+                self.target(scope, upstream),
+                headers=self.forward_headers(scope, skip=WEBSOCKET_HANDSHAKE),
+                protocols=scope.get("subprotocols", ())
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            logger.error(f"Upstream WebSocket {upstream} failed for {scope['path']}: {e}")
+            await send({"type": "websocket.close", "code": 1011})
+            return
+
+        await send({"type": "websocket.accept", "subprotocol": upstream_ws.protocol})
+
+        async def client_to_upstream():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    await upstream_ws.close()
+                    return
+                if message.get("bytes") is not None:
+                    await upstream_ws.send_bytes(message["bytes"])
+                elif message.get("text") is not None:
+                    await upstream_ws.send_str(message["text"])
+
+        async def upstream_to_client():
+            async for message in upstream_ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    await send({"type": "websocket.send", "text": message.data})
+                elif message.type == aiohttp.WSMsgType.BINARY:
+                    await send({"type": "websocket.send", "bytes": message.data})
+            # 1005, 1006 and 1015 only report what happened and can't be sent
+            code = upstream_ws.close_code
+            await send({"type": "websocket.close", "code": 1000 if code in (None, 1005, 1006, 1015) else code})
+
+        tasks = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream_ws.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    if self.session is not None:
+                        await self.session.close()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        upstream = self.upstream(scope["path"])
+        if upstream is None:
+            if scope["type"] == "websocket":
+                await receive()
+                return await send({"type": "websocket.close", "code": 1008})
+            return await self.local(scope, receive, send)
+
+        if scope["type"] == "websocket":
+            return await self.proxy_websocket(scope, receive, send, upstream)
+        await self.proxy_http(scope, receive, send, upstream)
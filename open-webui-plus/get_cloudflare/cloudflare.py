@@ -1,8 +1,8 @@
 import os
 import platform
-import requests
 import json
-import shutil
+import hashlib
+import re
 import sys
 from pathlib import Path
 import logging
@@ -12,6 +12,20 @@ import time
 # Initialize colorama
 init()
 
+# Release metadata comes from RELEASES_API_URL (overridable for a local
+# stand-in server) and is cached for RELEASE_CACHE_TTL seconds
+RELEASES_API_URL = os.environ.get(
+    "CLOUDFLARED_RELEASES_URL",
+    "https://api.github.com/repos/cloudflare/cloudflared/releases/latest"
+)
+BASE_DIR = Path('driver/cloudflared')
+RELEASE_CACHE_PATH = BASE_DIR / 'release.json'
+RELEASE_CACHE_TTL = 24 * 60 * 60
+
+# Downloads resume from a .part file and are read in large chunks
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 3
+
 # Configure logging
 class ColoredFormatter(logging.Formatter):
     """Custom formatter for colored logs"""
@@ -74,96 +88,200 @@ def get_system_info():
     except Exception as e:
         terminate_script(f"Failed to get system information: {str(e)}")
 
-def get_cloudflared_info():
-    """Get latest CloudFlared version and download URL from GitHub releases"""
+def get_binary_name():
+    """Get the platform directory and binary filename for this system"""
+    os_type, arch = get_system_info()
+    logger.debug(f"Detected system: {os_type}-{arch}")
+
+    # Construct filename based on system
+    if os_type == 'windows':
+        filename = f'cloudflared-{os_type}-{arch}.exe'
+    else:
+        filename = f'cloudflared-{os_type}-{arch}'
+    return f"{os_type}-{arch}", filename
+
+def is_executable(path):
+    return path.exists() and (platform.system() == 'Windows' or os.access(str(path), os.X_OK))
+
+def load_release_cache(max_age=RELEASE_CACHE_TTL):
+    """Return the cached release metadata if it is younger than max_age, else None"""
     try:
-        logger.info("Fetching latest CloudFlared release information...")
-        
-        api_url = "https://api.github.com/repos/cloudflare/cloudflared/releases/latest"
-        response = requests.get(api_url, timeout=30)
-        response.raise_for_status()
-        release_data = response.json()
-        version = release_data['tag_name'].replace('v', '')
-        
-        os_type, arch = get_system_info()
-        logger.debug(f"Detected system: {os_type}-{arch}")
-        
-        # Construct filename based on system
-        if os_type == 'windows':
-            filename = f'cloudflared-{os_type}-{arch}.exe'
-        else:
-            filename = f'cloudflared-{os_type}-{arch}'
-        
-        # Find matching asset URL
-        download_url = None
-        for asset in release_data['assets']:
-            if asset['name'] == filename:
-                download_url = asset['browser_download_url']
-                break
-                
-        if not download_url:
-            raise Exception(f"No compatible binary found for {os_type}-{arch}")
-        
-        return version, download_url, filename, os_type, arch
-    except requests.exceptions.RequestException as e:
-        terminate_script(f"Failed to fetch CloudFlared release info: {str(e)}")
+        with open(RELEASE_CACHE_PATH, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and time.time() - cached.get('fetched_at', 0) > max_age:
+        return None
+    return cached
+
+def fetch_release(api_url=RELEASES_API_URL):
+    """Fetch the latest release metadata and cache the parts we use"""
+    import requests
+
+    logger.info("Fetching latest CloudFlared release information...")
+    response = requests.get(api_url, timeout=30)
+    response.raise_for_status()
+    release_data = response.json()
+
+    release = {
+        'fetched_at': time.time(),
+        'version': release_data['tag_name'].replace('v', ''),
+        'assets': {
+            asset['name']: {
+                'url': asset['browser_download_url'],
+                'size': asset.get('size'),
+                'sha256': parse_checksum(asset.get('digest'), release_data.get('body'), asset['name'])
+            }
+            for asset in release_data['assets']
+        }
+    }
+
+    RELEASE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = RELEASE_CACHE_PATH.with_suffix('.part')
+    with open(temp_path, 'w') as f:
+        json.dump(release, f, indent=2)
+    os.replace(temp_path, RELEASE_CACHE_PATH)
+    return release
+
+def parse_checksum(digest, body, filename):
+    """Find an asset's SHA256, from its digest or the checksums in the release notes"""
+    if digest and digest.startswith('sha256:'):
+        return digest.split(':', 1)[1].lower()
+    match = re.search(rf'{re.escape(filename)}:\s*([0-9a-fA-F]{{64}})', body or '')
+    return match.group(1).lower() if match else None
+
+def get_cloudflared_info(filename, api_url=RELEASES_API_URL):
+    """
+    Get the CloudFlared version and download details for filename
+
+    Cached release metadata is used while it is fresh. When GitHub can't be
+    reached, stale metadata is better than none.
+    """
+    try:
+        release = load_release_cache()
+        if release is None:
+            try:
+                release = fetch_release(api_url)
+            except Exception as e:
+                release = load_release_cache(max_age=None)
+                if release is None:
+                    raise
+                logger.warning(f"Using cached release information, fetch failed: {str(e)}")
+
+        asset = release['assets'].get(filename)
+        if not asset:
+            raise Exception(f"No compatible binary found for {filename}")
+        return release['version'], asset
     except Exception as e:
-        terminate_script(f"Error getting CloudFlared info: {str(e)}")
+        terminate_script(f"Failed to get CloudFlared release info: {str(e)}")
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+def download_file(url, path, total_size=None):
+    """
+    Download url to path, resuming from path's .part file if there is one
+
+    Returns the path of the completed .part file. A .part file that can't
+    belong to this download, being larger than total_size or refused by the
+    server, is discarded and the download starts over.
+    """
+    import requests
+
+    part_path = Path(f"{path}.part")
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if total_size and offset > total_size:
+            logger.warning(f"Discarding partial download larger than expected ({offset} of {total_size} bytes)")
+            part_path.unlink()
+            offset = 0
+        if total_size and offset == total_size:
+            return part_path
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 416:
+                    # The server can't resume from here, so the .part is stale
+                    logger.warning(f"Server refused to resume at {offset} bytes, starting over")
+                    part_path.unlink(missing_ok=True)
+                    continue
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0
+                elif offset:
+                    logger.info(f"Resuming download at {offset} bytes")
+                total = total_size or (offset + int(response.headers.get('content-length', 0)))
 
-def download_cloudflared():
-    """Download CloudFlared and manage versions"""
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    downloaded = offset
+                    for data in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        downloaded += len(data)
+                        f.write(data)
+                        if total:
+                            done = int(50 * downloaded / total)
+                            percent = int(100 * downloaded / total)
+                            print(f"\rDownload progress: [{('=' * done) + (' ' * (50-done))}] {percent}%", end='')
+                print()  # New line after progress bar
+            return part_path
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Download attempt {attempt} of {DOWNLOAD_ATTEMPTS} failed: {str(e)}")
+    raise Exception(f"Download failed after {DOWNLOAD_ATTEMPTS} attempts")
+
+def download_cloudflared(api_url=RELEASES_API_URL):
+    """
+    Return the CloudFlared binary, downloading it only if it isn't on disk
+
+    An existing executable is used without any network access. Otherwise
+    the binary is downloaded (resuming an interrupted download), checked
+    against the release's SHA256, or its size when no SHA256 is published,
+    and made executable.
+    """
     try:
-        # Get system info and create directory structure
-        version, download_url, filename, os_type, arch = get_cloudflared_info()
-        platform_dir = f"{os_type}-{arch}"
-        
-        base_dir = Path('driver/cloudflared')
-        platform_path = base_dir / platform_dir
+        platform_dir, filename = get_binary_name()
+        platform_path = BASE_DIR / platform_dir
         binary_path = platform_path / filename
-        
+
         # First check if binary exists and is executable
-        if binary_path.exists() and (platform.system() == 'Windows' or os.access(str(binary_path), os.X_OK)):
+        if is_executable(binary_path):
             logger.info(f"CloudFlared binary already exists at: {binary_path}")
             return str(binary_path)
-        
+
+        version, asset = get_cloudflared_info(filename, api_url)
+
         try:
             platform_path.mkdir(parents=True, exist_ok=True)
         except Exception as e:
             terminate_script(f"Failed to create directory structure: {str(e)}")
-        
+
         logger.info(f"Using platform directory: {platform_path}")
-        
+
         # Download new version
-        logger.info("Downloading CloudFlared...")
+        logger.info(f"Downloading CloudFlared {version}...")
         try:
-            response = requests.get(download_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # Get file size for progress
-            total_size = int(response.headers.get('content-length', 0))
-            
-            # Save the binary with progress
-            with open(binary_path, 'wb') as f:
-                if total_size == 0:
-                    shutil.copyfileobj(response.raw, f)
-                else:
-                    downloaded = 0
-                    for data in response.iter_content(chunk_size=8192):
-                        downloaded += len(data)
-                        f.write(data)
-                        done = int(50 * downloaded / total_size)
-                        percent = int(100 * downloaded / total_size)
-                        print(f"\rDownload progress: [{('=' * done) + (' ' * (50-done))}] {percent}%", end='')
-            print()  # New line after progress bar
+            part_path = download_file(asset['url'], binary_path, asset.get('size'))
         except Exception as e:
-            # Clean up failed download
-            if binary_path.exists():
-                try:
-                    binary_path.unlink()
-                except:
-                    pass
             terminate_script(f"Failed to download CloudFlared: {str(e)}")
-        
+
+        if asset.get('sha256'):
+            checksum = sha256_file(part_path)
+            if checksum != asset['sha256']:
+                part_path.unlink()
+                terminate_script(f"Checksum mismatch for CloudFlared download: expected {asset['sha256']}, got {checksum}")
+            logger.info("Verified SHA256 checksum")
+        elif asset.get('size'):
+            size = part_path.stat().st_size
+            if size != asset['size']:
+                part_path.unlink()
+                terminate_script(f"Size mismatch for CloudFlared download: expected {asset['size']} bytes, got {size}")
+            logger.warning("No checksum published for this binary, verified its size only")
+        else:
+            logger.warning("No checksum published for this binary, skipping verification")
+        os.replace(part_path, binary_path)
+
         # Make binary executable on Unix systems
         if platform.system() != 'Windows':
             try:
@@ -171,19 +289,17 @@ def download_cloudflared():
                 logger.info("Set executable permissions")
             except Exception as e:
                 terminate_script(f"Failed to set executable permissions: {str(e)}")
-        
-        # Verify binary exists and is executable
-        if not binary_path.exists():
-            terminate_script("Binary not found after download")
-        
-        if not os.access(str(binary_path), os.X_OK) and platform.system() != 'Windows':
+
+        if not is_executable(binary_path):
             terminate_script("Binary is not executable after setting permissions")
-        
+
         logger.info(f"Successfully downloaded CloudFlared")
         logger.info(f"Binary location: {binary_path}")
-        
+
         return str(binary_path)
-        
+
+    except SystemExit:
+        raise
     except Exception as e:
         terminate_script(f"Error downloading CloudFlared: {str(e)}")
 if __name__ == "__main__":
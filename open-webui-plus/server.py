@@ -1,11 +1,15 @@
 import util
 import os
-import tts
-import subprocess
+import shutil
+import signal
 import logging
-from get_cloudflare import cloudflare
 import threading
-from flask import Flask, render_template, abort
+import socket
+import time
+from supervisor import Supervisor, Child
+from gateway import Gateway
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, abort, jsonify
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 import sys
@@ -47,54 +51,170 @@ def create_struc(dir_list):
 # Create Flask apps with shared template folder
 template_dir = os.path.abspath(os.path.join(os.getcwd(), "open-webui-plus" , 'templates'))
 
-# TTS app
-tts_app = tts.create_app()
-tts_app.template_folder = template_dir
-tts_logger = setup_logger('tts_server', 'tts_server.log')
-
 # Open-webui-plus app
 open_webui_plus_app = Flask("Open-WebUI-Plus", 
                           template_folder=template_dir,
                           static_folder=os.path.join(os.getcwd(), 'static'))
 main_logger = setup_logger('main_server', 'main_server.log')
 
-# Add logging to both apps
-for handler in tts_logger.handlers:
-    tts_app.logger.addHandler(handler)
-tts_app.logger.setLevel(logging.INFO)
-
+# Add logging to the app
 for handler in main_logger.handlers:
     open_webui_plus_app.logger.addHandler(handler)
 open_webui_plus_app.logger.setLevel(logging.INFO)
 
-# TTS app runner
-def run_tts(app, port, host="0.0.0.0"):
-    util.tost(f"\nStarting TTS server at port:{port}", "green")
-    tts_logger.info(f"\nStarting TTS server at http://{host}:{port}")
-    util.run_cloudflare(port, "TTS Server Access URL", path=os.path.join(os.getcwd(), "access", "cloudflare_tts_url.txt"))
-    app.run(port=port, host=host)
-
 # Download cloudflared
 def get_cloudflared():
+    # Imported here, it pulls in requests
+    from get_cloudflare import cloudflare
+
     cloudflared_driver_path = cloudflare.download_cloudflared()
     with open(os.path.join(os.getcwd(), "access", "cloudflare.txt"), "w") as cl:
         cl.write(cloudflared_driver_path)
 
-# Run main server
+# Run main server, the gateway in front of every service
 def open_web_ui_plus(app, port, host="0.0.0.0"):
+    import uvicorn
+
     util.tost(f"\nStarting Main server on port:{port}", "green")
     main_logger.info(f"\nStarting Main server at http://{host}:{port}")
-    util.run_cloudflare(port, "Main server access:", path=os.path.join(os.getcwd(), "access", "cloudflare_main_url.txt"))
-    app.run(port=port, host=host)
+    uvicorn.Server(uvicorn.Config(app, host=host, port=port)).run()
+
+# Tunnels by registry name: (port, message, access file). The gateway
+# carries all of the traffic, so one tunnel is enough.
+tunnels = {
+    "main": (7800, "Main server access:", "cloudflare_main_url.txt")
+}
+
+# How long startup waits for a server port or tunnel URL before reporting
+STARTUP_TIMEOUT = 120
+
+# Child services by name: (command, port, health check path, startup grace).
+# STT and open-webui download models on their first start, so they get
+# longer to come up than the supervisor's default.
+base_dir = os.path.dirname(os.path.abspath(__file__))
+services = {
+    "tts": ([sys.executable, os.path.join(base_dir, "tts.py"), "--port", "3400"], 3400, "/v1/models", None),
+    "stt": ([sys.executable, os.path.join(base_dir, "stt", "stt01.py")], 3401, "/whisper/v1/health", 600),
+    "open-webui": ([shutil.which("open-webui") or "open-webui", "serve"], 8080, "/health", 900)
+}
+
+# Owns every child process: the services above and the tunnels
+supervisor = Supervisor()
+
+class StartupTimer:
+    """Run startup phases, concurrently where they are independent, and time each one"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def run(self, name, func, *args):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            result = func(*args)
+            if result is False:
+                status = "timed out"
+            return result
+        except Exception:
+            status = "failed"
+            raise
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.phases.append((name, start - self.started, end - start, status))
+
+    def parallel(self, phases):
+        """Run (name, func, *args) phases at once and wait for all of them"""
+        with ThreadPoolExecutor(max_workers=len(phases)) as pool:
+            futures = [pool.submit(self.run, *phase) for phase in phases]
+        for future in futures:
+            future.result()
+
+    def report(self):
+        lines = [f"{'phase':<24} {'start':>8} {'took':>8}"]
+        for name, offset, duration, status in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<24} {offset:7.2f}s {duration:7.2f}s {'' if status == 'ok' else status}")
+        lines.append(f"{'total':<24} {'':>8} {time.perf_counter() - self.started:7.2f}s")
+        util.tost("Startup timing\n" + "\n".join(lines), "cyan")
+        main_logger.info("Startup timing\n" + "\n".join(lines))
+
+def wait_for_port(port, timeout=STARTUP_TIMEOUT):
+    """Wait until a local server accepts connections, False on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def start_tunnel(name):
+    """Start a supervised tunnel and wait for its URL, False on timeout"""
+    port, message, filename = tunnels[name]
+    path = os.path.join(os.getcwd(), "access", filename)
+    supervisor.add(Child(
+        f"tunnel {name}",
+        util.cloudflare_command(port),
+        on_start=lambda process: util.watch_tunnel(process, message, path, name)
+    ))
+    return util.tunnel_registry.wait(name, STARTUP_TIMEOUT) is not None
+
+def start_tunnels(timer):
+    """Fetch cloudflared, then open every tunnel at once"""
+    timer.run("cloudflared", get_cloudflared)
+    timer.parallel([(f"tunnel {name}", start_tunnel, name) for name in tunnels])
+
+def start_service(name):
+    """Start a supervised service and wait for its port, False on timeout"""
+    command, port, health_path, startup_grace = services[name]
+    util.tost(f"\nStarting {name} on port:{port}", "green")
+    supervisor.add(Child(
+        name,
+        command,
+        health_url=f"http://127.0.0.1:{port}{health_path}",
+        startup_grace=startup_grace
+    ))
+    return wait_for_port(port, startup_grace or STARTUP_TIMEOUT)
+
+def start_server(target, app, port):
+    threading.Thread(target=target, args=(app, port), daemon=True).start()
+    return wait_for_port(port)
 
 route_ui = open_webui_plus_app  # for easy reference
 
-@route_ui.route("/")
+# Main pages, served by the gateway itself. "/" belongs to open-webui.
+main_pages = ["/plus", "/access-points", "/access-points.json", "/health"]
+
+# Everything else goes to a service by path prefix, and then to open-webui
+gateway = Gateway(
+    open_webui_plus_app,
+    main_pages,
+    routes=[
+        ("/v1/", f"http://127.0.0.1:{services['tts'][1]}"),
+        ("/whisper/", f"http://127.0.0.1:{services['stt'][1]}")
+    ],
+    default=f"http://127.0.0.1:{services['open-webui'][1]}"
+)
+
+# Services listed on the access points page: (supervised child, title, path)
+access_points = [
+    (None, "Main Server", "/plus"),
+    ("tts", "TTS Server", "/v1"),
+    ("stt", "STT Server", "/whisper/v1"),
+    ("open-webui", "Open Web UI Server", "/")
+]
+
+@route_ui.route("/plus")
 def get_tts():
     try:
-        with open(os.path.join(os.getcwd(), "access", "cloudflare_tts_url.txt"), "r") as cl:
-            url = cl.read().strip()  # Added strip() to remove any whitespace
-        
+        main_url = util.tunnel_registry.get("main", "")
+        if not main_url:
+            main_logger.info("Tunnel not up yet")
+            return "The tunnel is still starting, refresh in a few seconds.", 503
+
         main_logger.info("TTS endpoint accessed")
         main_logger.debug(f"Template directory: {template_dir}")
         
@@ -102,8 +222,8 @@ def get_tts():
             'tts_url.html',
             title='TTS url',
             header_text="Here's Your TTS Url",
-            message=f'Just go to the open-webui and in the audio section choose \n openai \n And in creds add \n api key = open-web-ui-plus \n in voice add from \n fast \n normal \n slow \n in voice model choose from models go to this url {url}/v1/models and just save the settings \n Also for other url visit {util.get_content(os.path.join(os.getcwd(), "access", "cloudflare_main_url.txt"))}/access-points',
-            url=f'{url}/v1',
+            message=f'Just go to the open-webui and in the audio section choose \n openai \n And in creds add \n api key = open-web-ui-plus \n in voice add from \n fast \n normal \n slow \n in voice model choose from models go to this url {main_url}/v1/models and just save the settings \n Also for other url visit {main_url}/access-points',
+            url=f'{main_url}/v1',
             footer_text='open-webui-plus',
             now=datetime
         )
@@ -116,61 +236,51 @@ def get_tts():
 
 @route_ui.route("/access-points")
 def ac_p():
-    urls = [
-    {'name': 'Main Server', 'url': f'{util.get_content(os.path.join(os.getcwd(), "access", "cloudflare_main_url.txt"))}', 'status': 'active'},
-    {'name': 'TTS Server', 'url': f'{util.get_content(os.path.join(os.getcwd(), "access", "cloudflare_tts_url.txt"))}', 'status': 'active'},
-    {'name': 'STT Server', 'url': f'{util.get_content(os.path.join(os.getcwd(), "access", "cloudflare_stt_url.txt"))}', 'status': 'active'},
-    {'name': 'Open Web UI Server', 'url': f'{util.get_content(os.path.join(os.getcwd(), "access", "cloudflare_open-webui_url.txt"))}', 'status': 'active'}
-      ]
+    main_url = util.tunnel_registry.get("main")
+    children = supervisor.snapshot()
+    urls = []
+    for name, title, path in access_points:
+        active = bool(main_url) and (name is None or children.get(name, {}).get("healthy", False))
+        urls.append({'name': title, 'url': f"{main_url}{path}" if main_url else '', 'status': 'active' if active else 'inactive'})
 
     return render_template("access_points.html" , urls = urls)
+
+@route_ui.route("/health")
+def health():
+    """Main server health, with the state of every supervised child"""
+    return jsonify({"status": "ok", "children": supervisor.snapshot()})
+
+@route_ui.route("/access-points.json")
+def ac_p_json():
+    """Current tunnel URLs, for dashboards to poll"""
+    return jsonify(util.tunnel_registry.snapshot())
 # Main server run
 if __name__ == "__main__":
+    # Let a plain kill shut the children down too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     try:
-        create_struc(needed_dirs)  # create project structure
-        main_logger.info("Created project directory structure")
+        supervisor.start()
+        timer = StartupTimer()
+        timer.run("directories", create_struc, needed_dirs)  # create project structure
         main_logger.info(f"Template directory set to: {template_dir}")
-        
-        get_cloudflared()  # download cloudflared driver
-        main_logger.info("Downloaded cloudflared driver")
-        
-        tts.DatabaseManager.init_db()  # start database tts
-        main_logger.info("Initialized TTS database")
-        
-        tts.CleanupService.start()  # start cleanup service
-        main_logger.info("Started cleanup service")
-        #start open-webui
-        subprocess.Popen("open-webui serve" , shell = True)
-        main_logger.info("Started open-webui")
-        util.tost("Access open-webui at port 8080" , "blue")
-        util.run_cloudflare(8080, "Open-webui Access:", path=os.path.join(os.getcwd(), "access", "cloudflare_open-webui_url.txt"))
-        util.tost("Access STT engine at port 3401" , "blue")
-        util.run_cloudflare(3401, "STT Access:", path=os.path.join(os.getcwd(), "access", "cloudflare_stt_url.txt"))
-        # Create threads for both servers
-        tts_thread = threading.Thread(
-            target=run_tts,
-            args=(tts_app, 3400),
-            daemon=True
-        )
-        main_thread = threading.Thread(
-            target=open_web_ui_plus,
-            args=(open_webui_plus_app, 7800),
-            daemon=True
-        )
 
-        # Start both servers
-        tts_thread.start()
-        main_thread.start()
-        main_logger.info("Started both TTS and Main servers")
+        # Servers, open-webui and the tunnels don't depend on each other
+        timer.parallel([
+            ("tunnels", start_tunnels, timer),
+            *[(name, start_service, name) for name in services],
+            ("main server", start_server, open_web_ui_plus, gateway, tunnels["main"][0])
+        ])
+        timer.report()
 
         # Keep the main thread alive
         while True:
-            tts_thread.join(1)
-            main_thread.join(1)
-            
+            time.sleep(1)
+
     except KeyboardInterrupt:
         main_logger.info("Shutting down servers...")
         print("\nShutting down servers...")
     except Exception as e:
         main_logger.error(f"Error occurred: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        supervisor.stop()
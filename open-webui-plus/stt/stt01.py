@@ -1,100 +1,1062 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+import io
 import os
+import hashlib
+import sys
+import json
 from faster_whisper import WhisperModel
-import tempfile
-import torch
+from faster_whisper.audio import decode_audio, pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_compression_ratio, get_ctranslate2_storage
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+import ctranslate2
 import time
+import threading
+import logging
+import queue
+import itertools
+import math
+import multiprocessing
+import socket
+import argparse
+import asyncio
+from urllib.parse import parse_qs
+import av
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 # T4-compatible model configurations
+# memory_mb is the estimated resident size, used for the model pool budget;
+# beam_size is the default, 1 being greedy decoding
 MODELS = {
     "base": {
         "size": "base",
-        "description": "Whisper Base Model - Fast"
+        "description": "Whisper Base Model - Fast",
+        "memory_mb": 400,
+        "beam_size": 1
     },
     "small": {
         "size": "small",
-        "description": "Whisper Small Model - Balanced"
+        "description": "Whisper Small Model - Balanced",
+        "memory_mb": 1000,
+        "beam_size": 1
     },
     "medium": {
         "size": "medium",
-        "description": "Whisper Medium Model - Accurate"
+        "description": "Whisper Medium Model - Accurate",
+        "memory_mb": 3000,
+        "beam_size": 1
     },
     "large-v3": {
         "size": "large-v3",
-        "description": "Whisper Large V3 - Most Accurate"
+        "description": "Whisper Large V3 - Most Accurate",
+        "memory_mb": 6000,
+        "beam_size": 1
     }
 }
 
+# OpenAI model names mapped onto local models
+MODEL_ALIASES = {
+    "whisper-1": "base"
+}
+
+# Models loaded and warmed up at startup, and the memory budget for loaded
+# models, shared out equally between the transcription workers
+PRELOAD_MODELS = ["base"]
+MODEL_MEMORY_BUDGET_MB = 8000
+
+# Transcription worker processes, each with its own models and an equal share
+# of the CPU cores; 0 transcribes in the server process with CPU_THREADS
+TRANSCRIPTION_WORKERS = max(1, (os.cpu_count() or 1) // 8)
+CPU_THREADS = 4
+
+# Concurrent requests for the same model are grouped into batches of up to
+# BATCH_MAX_SIZE, waiting at most BATCH_MAX_WAIT seconds for a batch to fill.
+# Clips longer than BATCH_MAX_DURATION seconds of speech are transcribed alone
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT = 0.05
+BATCH_MAX_DURATION = 30
+
+# With more than one worker, audio longer than LONG_AUDIO_SECONDS is split at
+# silences into one chunk per worker (of at least LONG_AUDIO_MIN_CHUNK
+# seconds), transcribed in parallel and stitched back together
+LONG_AUDIO_SECONDS = 120
+LONG_AUDIO_MIN_CHUNK = 60
+
+SAMPLE_RATE = 16000
+VAD_PARAMETERS = dict(
+    min_silence_duration_ms=500,
+    speech_pad_ms=400
+)
+NO_SPEECH_THRESHOLD = 0.6
+MAX_BEAM_SIZE = 10
+
+# OpenAI response formats and the content types of the plain-text ones
+RESPONSE_FORMATS = {
+    "json": None,
+    "verbose_json": None,
+    "text": "text/plain",
+    "srt": "text/plain",
+    "vtt": "text/vtt"
+}
+TIMESTAMP_GRANULARITIES = ("segment", "word")
+
+# Best compute type and thread count per model, written by
+# `python stt01.py benchmark` and keyed by host
+TUNING_PATH = "./models/autotune.json"
+BENCHMARK_SAMPLE = "./models/benchmark-sample.mp3"
+BENCHMARK_TEXT = (
+    "The quick brown fox jumps over the lazy dog. Speech recognition turns "
+    "spoken words into text, and its speed depends on the model size, the "
+    "numeric precision used for inference and the number of threads. This "
+    "sample is read aloud once and transcribed with every configuration so "
+    "that their real-time factors can be compared on this machine."
+)
+
+# Uploads are decoded to 16 kHz mono float32 samples on a shared thread pool
+# in the server process, so decoding overlaps inference in the workers
+DECODE_THREADS = 4
+
+# Real-time transcription over WebSocket: the utterance so far is checked
+# with VAD every REALTIME_STEP seconds of audio, sending a partial hypothesis,
+# and finalized after REALTIME_END_SILENCE seconds without speech or once it
+# reaches REALTIME_MAX_UTTERANCE seconds
+REALTIME_STEP = 1.0
+REALTIME_END_SILENCE = 0.5
+REALTIME_MAX_UTTERANCE = 30
+
+# Finished transcriptions are cached on disk, keyed by the decoded audio and
+# the options, and evicted least recently used first beyond the size limit
+TRANSCRIPTION_CACHE_ENABLED = True
+TRANSCRIPTION_CACHE_DIR = "./cache/transcriptions"
+TRANSCRIPTION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Uploads are held in memory, up to this size (an hour of 16 kHz 16-bit mono
+# WAV is about 115 MB); larger requests are refused with 413
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+
+class UploadRequest(Request):
+    """Request that keeps uploaded files in memory instead of temporary files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
+app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
+
+
+def resolve_model_id(model_id):
+    """Map an OpenAI alias such as whisper-1 onto a local model id"""
+    return MODEL_ALIASES.get(model_id, model_id)
+
+
+def device():
+    """Return the device models run on, asking CTranslate2 rather than torch"""
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+
+def load_model(model_size, compute_type=None, cpu_threads=None):
+    """Load a Whisper model"""
+    return WhisperModel(
+        model_size_or_path=model_size,
+        device=device(),
+        compute_type=compute_type or ("float16" if device() == "cuda" else "float32"),
+        download_root="./models",
+        cpu_threads=cpu_threads or CPU_THREADS,
+        num_workers=1,
+    )
+
+
+def host_key():
+    """Identify this machine's hardware for the tuning file"""
+    gpus = ctranslate2.get_cuda_device_count()
+    return f"{socket.gethostname()}/{f'cuda{gpus}' if gpus else 'cpu'}/{os.cpu_count()}"
+
+
+def load_tuning():
+    """Load the benchmarked configuration for this host, if any"""
+    try:
+        with open(TUNING_PATH) as f:
+            return json.load(f).get(host_key(), {})
+    except (OSError, ValueError):
+        return {}
+
+
+def tuned_settings(model_id):
+    """
+    Return load_model arguments for the benchmarked configuration
+
+    The thread count is capped at this process's CPU_THREADS share.
+    """
+    tuned = tuning.get(model_id)
+    if not tuned:
+        return {}
+    return {
+        "compute_type": tuned["compute_type"],
+        "cpu_threads": min(tuned["cpu_threads"], CPU_THREADS)
+    }
+
+
+class ModelPool:
+    """
+    Keep loaded models within a memory budget.
+
+    Models are evicted least recently used first when loading another one
+    would exceed the budget. Load time and residency are tracked per model.
+    """
+
+    def __init__(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+        self.stats = {
+            model_id: {
+                "loads": 0,
+                "evictions": 0,
+                "requests": 0,
+                "last_load_seconds": None,
+                "loaded_at": None
+            }
+            for model_id in MODELS
+        }
+
+    def memory_used_mb(self):
+        return sum(MODELS[model_id]["memory_mb"] for model_id in self.models)
+
+    def get(self, model_id):
+        """Get a loaded model, loading it if needed"""
+        with self.lock:
+            self.stats[model_id]["requests"] += 1
+            if model_id in self.models:
+                self.models.move_to_end(model_id)
+                return self.models[model_id]
+            load_lock = self.load_locks.setdefault(model_id, threading.Lock())
+
+        # Only one thread loads a given model; the others wait for it
+        with load_lock:
+            with self.lock:
+                if model_id in self.models:
+                    self.models.move_to_end(model_id)
+                    return self.models[model_id]
+                self.evict_for(model_id)
+
+            start = time.perf_counter()
+            model = load_model(MODELS[model_id]["size"], **tuned_settings(model_id))
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                self.models[model_id] = model
+                self.stats[model_id]["loads"] += 1
+                self.stats[model_id]["last_load_seconds"] = round(elapsed, 3)
+                self.stats[model_id]["loaded_at"] = time.time()
+            logger.info(f"Loaded model {model_id} in {elapsed:.2f}s")
+            return model
+
+    def evict_for(self, model_id):
+        """Evict least recently used models until model_id fits the budget (lock held)"""
+        needed = MODELS[model_id]["memory_mb"]
+        while self.models and self.memory_used_mb() + needed > self.budget_mb:
+            evicted, _ = self.models.popitem(last=False)
+            self.stats[evicted]["evictions"] += 1
+            self.stats[evicted]["loaded_at"] = None
+            logger.info(f"Evicted model {evicted} to stay within {self.budget_mb} MB")
+        if needed > self.budget_mb:
+            logger.warning(f"Model {model_id} alone exceeds the {self.budget_mb} MB budget")
+
+    def snapshot(self):
+        """Return load and residency statistics"""
+        now = time.time()
+        with self.lock:
+            return {
+                "memory_budget_mb": self.budget_mb,
+                "memory_used_mb": self.memory_used_mb(),
+                "loaded": list(self.models),
+                "models": {
+                    model_id: {
+                        "loaded": model_id in self.models,
+                        "loads": stats["loads"],
+                        "evictions": stats["evictions"],
+                        "requests": stats["requests"],
+                        "last_load_seconds": stats["last_load_seconds"],
+                        "resident_seconds": (
+                            round(now - stats["loaded_at"], 1) if stats["loaded_at"] else None
+                        )
+                    }
+                    for model_id, stats in self.stats.items()
+                }
+            }
+
+
 # Model cache to avoid reloading
-loaded_models = {}
+tuning = load_tuning()
+model_pool = ModelPool(MODEL_MEMORY_BUDGET_MB)
+preload_state = {"status": "pending", "seconds": None}
 
 def get_model(model_id="whisper-1"):
     """Get or load the requested model"""
-    model_size = MODELS.get(model_id, MODELS["whisper-1"])["size"]
-
-    if model_size not in loaded_models:
-        # Initialize Whisper model with GPU support
-        loaded_models[model_size] = WhisperModel(
-            model_size_or_path=model_size,
-            device="cuda" if torch.cuda.is_available() else "cpu",
-            compute_type="float16" if torch.cuda.is_available() else "float32",
-            download_root="./models",
-            cpu_threads=4,
-            num_workers=1,
-        )
+    model_id = resolve_model_id(model_id)
+    if model_id not in MODELS:
+        model_id = resolve_model_id("whisper-1")
+    return model_pool.get(model_id)
+
+def preload_models(model_ids=None):
+    """Load and warm up models so the first requests don't pay for it"""
+    preload_state["status"] = "loading"
+    start = time.perf_counter()
+    for model_id in model_ids or PRELOAD_MODELS:
+        try:
+            model = get_model(model_id)
+            # One second of silence runs the encoder and decoder once
+            segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), beam_size=1)
+            list(segments)
+        except Exception as e:
+            logger.error(f"Failed to preload model {model_id}: {e}")
+    preload_state["seconds"] = round(time.perf_counter() - start, 3)
+    preload_state["status"] = "complete"
 
-    return loaded_models[model_size]
+def default_beam_size(model_id):
+    """Return the configured beam size of a model"""
+    return MODELS.get(resolve_model_id(model_id), {}).get("beam_size", 1)
 
-def transcribe_audio(audio_path, model_id="whisper-1", prompt=None, language=None):
+def format_segment(segment_id, segment):
+    """Convert a faster-whisper segment to the OpenAI verbose_json format"""
+    formatted = {
+        "id": segment_id,
+        "seek": segment.seek,
+        "start": segment.start,
+        "end": segment.end,
+        "text": segment.text,
+        "tokens": list(segment.tokens),
+        "temperature": segment.temperature,
+        "avg_logprob": segment.avg_logprob,
+        "compression_ratio": segment.compression_ratio,
+        "no_speech_prob": segment.no_speech_prob
+    }
+    if segment.words:
+        formatted["words"] = [
+            {"word": word.word, "start": word.start, "end": word.end, "probability": word.probability}
+            for word in segment.words
+        ]
+    return formatted
+
+def decode_segments(audio, model_id="whisper-1", prompt=None, language=None, word_timestamps=False, beam_size=None):
     """
-    Transcribe audio using selected whisper model
+    Start transcribing audio using selected whisper model in this process
+
+    Returns the transcription info and a generator that decodes and yields
+    formatted segments one at a time. The generator can only be consumed once.
+    Word timestamps are only aligned when asked for, and beam_size defaults
+    to the model's setting.
     """
     model = get_model(model_id)
 
     segments, info = model.transcribe(
-        audio_path,
-        beam_size=5,
-        word_timestamps=True,
+        audio,
+        beam_size=beam_size or default_beam_size(model_id),
+        word_timestamps=word_timestamps,
         vad_filter=True,
-        vad_parameters=dict(
-            min_silence_duration_ms=500,
-            speech_pad_ms=400
-        ),
+        vad_parameters=VAD_PARAMETERS,
         initial_prompt=prompt,
         language=language,
         temperature=0.0,
         condition_on_previous_text=False,
-        no_speech_threshold=0.6
+        no_speech_threshold=NO_SPEECH_THRESHOLD
     )
 
-    # Combine all segments
-    full_text = " ".join(segment.text for segment in segments)
+    info = {"language": info.language, "duration": info.duration}
+    return info, (format_segment(i, segment) for i, segment in enumerate(segments))
+
+def load_speech(audio):
+    """
+    Keep only the speech found in decoded audio by voice activity detection
+
+    Returns the duration in seconds, the speech chunks (as sample offsets)
+    and the speech samples.
+    """
+    chunks = get_speech_timestamps(audio, VadOptions(**VAD_PARAMETERS))
+    return len(audio) / SAMPLE_RATE, chunks, collect_chunks(audio, chunks)
+
+def transcribe_batch(jobs):
+    """
+    Transcribe several short clips for the same model in one pass
+
+    The clips' speech is encoded together and decoded with a single batched
+    search, so each clip becomes one segment. Clips with more than
+    BATCH_MAX_DURATION seconds of speech are left out. The jobs share their
+    beam size and don't ask for word timestamps.
+
+    Returns a dict mapping job ids to (info, segments).
+    """
+    model = get_model(jobs[0]["model"])
+    whisper = model.model
+
+    clips = []
+    results = {}
+    for job in jobs:
+        duration, chunks, speech = load_speech(job["audio"])
+        if len(speech) > BATCH_MAX_DURATION * SAMPLE_RATE:
+            continue
+        if len(speech) == 0:
+            results[job["id"]] = ({"language": job["language"] or "en", "duration": duration}, [])
+            continue
+        clips.append((job, duration, chunks, speech))
+
+    if not clips:
+        return results
+
+    frames = model.feature_extractor.nb_max_frames
+    features = np.stack([
+        pad_or_trim(model.feature_extractor(speech), frames)
+        for _, _, _, speech in clips
+    ])
+    encoder_output = whisper.encode(get_ctranslate2_storage(features), to_cpu=False)
+
+    languages = [job["language"] for job, _, _, _ in clips]
+    if whisper.is_multilingual and None in languages:
+        detected = whisper.detect_language(encoder_output)
+        languages = [
+            language or detected[i][0][0][2:-2]
+            for i, language in enumerate(languages)
+        ]
+
+    prompts = []
+    tokenizers = []
+    for (job, _, _, _), language in zip(clips, languages):
+        tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            whisper.is_multilingual,
+            task="transcribe",
+            language=language or "en"
+        )
+        previous_tokens = tokenizer.encode(" " + job["prompt"].strip()) if job["prompt"] else None
+        prompts.append(model.get_prompt(tokenizer, previous_tokens, without_timestamps=True))
+        tokenizers.append(tokenizer)
+
+    outputs = whisper.generate(
+        encoder_output,
+        prompts,
+        beam_size=jobs[0]["beam_size"] or default_beam_size(jobs[0]["model"]),
+        max_length=model.max_length,
+        return_scores=True,
+        return_no_speech_prob=True,
+        suppress_blank=True,
+        suppress_tokens=[-1]
+    )
+
+    for (job, duration, chunks, _), language, tokenizer, output in zip(clips, languages, tokenizers, outputs):
+        tokens = output.sequences_ids[0]
+        avg_logprob = output.scores[0] * len(tokens) / (len(tokens) + 1)
+        text = tokenizer.decode(tokens)
+        info = {"language": language or "en", "duration": duration}
+        if (output.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < -1) or not text.strip():
+            results[job["id"]] = (info, [])
+            continue
+        results[job["id"]] = (info, [{
+            "id": 0,
+            "seek": 0,
+            "start": round(chunks[0]["start"] / SAMPLE_RATE, 3),
+            "end": round(chunks[-1]["end"] / SAMPLE_RATE, 3),
+            "text": text,
+            "tokens": tokens,
+            "temperature": 0.0,
+            "avg_logprob": avg_logprob,
+            "compression_ratio": get_compression_ratio(text),
+            "no_speech_prob": output.no_speech_prob
+        }])
+
+    return results
+
+class TranscriptionCache:
+    """
+    Cache finished transcriptions on disk.
+
+    Each entry is a JSON file named after its key. A file's modification
+    time records its last use, so the least recently used entries are
+    evicted first once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Index the entries left by previous runs, oldest first"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        with self.lock:
+            for _, key, size in sorted(entries):
+                self.entries[key] = size
+                self.size += size
+
+    @staticmethod
+    def make_key(audio, model_id, language, prompt, word_timestamps=False, beam_size=None, need_segments=True):
+        """Hash the decoded samples together with the options that change the result"""
+        digest = hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        digest.update(json.dumps([
+            resolve_model_id(model_id),
+            language,
+            prompt,
+            word_timestamps,
+            beam_size or default_beam_size(model_id),
+            # Batched jobs come back as one segment per clip
+            need_segments
+        ]).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached (info, segments) for key, or None"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.path(key)) as f:
+                entry = json.load(f)
+            os.utime(self.path(key))
+        except (OSError, ValueError):
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return entry["info"], entry["segments"]
+
+    def put(self, key, info, segments):
+        """Store a finished transcription and evict old entries over the limit"""
+        data = json.dumps({"info": info, "segments": segments})
+        temp_path = f"{self.path(key)}.part"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "w") as f:
+                f.write(data)
+            os.replace(temp_path, self.path(key))
+        except OSError as e:
+            logger.warning(f"Failed to cache transcription: {e}")
+            return
+
+        with self.lock:
+            self.size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            evicted = []
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+
+    def snapshot(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 3) if requests else None
+            }
+
+
+transcription_cache = TranscriptionCache(TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_MAX_BYTES)
+
+def iter_segments(audio, model_id="whisper-1", prompt=None, language=None, client=None, word_timestamps=False, beam_size=None, need_segments=True):
+    """
+    Start transcribing audio, from the cache when it has been seen before
+
+    Returns the transcription info ({"language", "duration"}) and a generator
+    of formatted segments, yielded as they are decoded. A transcription
+    consumed to the end is added to the cache.
+    """
+    if not TRANSCRIPTION_CACHE_ENABLED:
+        return start_transcription(audio, model_id, prompt, language, client, word_timestamps, beam_size, need_segments)
+
+    key = transcription_cache.make_key(audio, model_id, language, prompt, word_timestamps, beam_size, need_segments)
+    cached = transcription_cache.get(key)
+    if cached:
+        info, segments = cached
+        return info, iter(segments)
+
+    info, segments = start_transcription(audio, model_id, prompt, language, client, word_timestamps, beam_size, need_segments)
+
+    def caching():
+        decoded = []
+        for segment in segments:
+            decoded.append(segment)
+            yield segment
+        transcription_cache.put(key, info, decoded)
+
+    return info, caching()
+
+def start_transcription(audio, model_id="whisper-1", prompt=None, language=None, client=None, word_timestamps=False, beam_size=None, need_segments=True):
+    """
+    Start transcribing audio, on the worker pool when it is running
+
+    Returns the transcription info and a generator of formatted segments.
+    Only jobs that don't need segments (just the text) may be batched, as a
+    batched job comes back as one segment per clip.
+    """
+    if worker_pool is None:
+        return decode_segments(audio, model_id, prompt, language, word_timestamps, beam_size)
+
+    if worker_pool.size > 1 and len(audio) > LONG_AUDIO_SECONDS * SAMPLE_RATE:
+        return split_transcription(audio, model_id, prompt, language, client, word_timestamps, beam_size, need_segments)
+
+    return read_messages(submit_job(audio, model_id, prompt, language, client, word_timestamps, beam_size, need_segments))
+
+def submit_job(audio, model_id, prompt, language, client, word_timestamps=False, beam_size=None, need_segments=True):
+    """Queue audio on the worker pool and return the queue of its messages"""
+    return worker_pool.submit({
+        "audio": audio,
+        "model": model_id,
+        "prompt": prompt,
+        "language": language,
+        "word_timestamps": word_timestamps,
+        "beam_size": beam_size or default_beam_size(model_id),
+        "need_segments": need_segments
+    }, client)
+
+def read_messages(messages):
+    """
+    Wait for a pool job to start
+
+    Returns its info and a generator of the segments it reports.
+    """
+    kind, payload = messages.get()
+    if kind == "error":
+        raise RuntimeError(payload)
+
+    def segments():
+        while True:
+            kind, payload = messages.get()
+            if kind == "segment":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise RuntimeError(payload)
+
+    return payload, segments()
+
+def split_points(audio, parts):
+    """
+    Choose sample offsets that cut audio into about `parts` chunks
+
+    Cuts are made in the middle of silences found by VAD, at the first
+    silence after each chunk reaches its share of the audio.
+    """
+    speech = get_speech_timestamps(audio, VadOptions(**VAD_PARAMETERS))
+    target = max(len(audio) / parts, LONG_AUDIO_MIN_CHUNK * SAMPLE_RATE)
+    cuts = [0]
+    for previous, following in zip(speech, speech[1:]):
+        middle = (previous["end"] + following["start"]) // 2
+        if middle - cuts[-1] >= target and len(audio) - middle >= target / 2:
+            cuts.append(middle)
+    return cuts + [len(audio)]
+
+def shift_segment(segment, segment_id, offset):
+    """Move a chunk's segment to its place in the whole recording"""
+    segment = dict(
+        segment,
+        id=segment_id,
+        seek=segment["seek"] + round(offset * 100),
+        start=round(segment["start"] + offset, 3),
+        end=round(segment["end"] + offset, 3)
+    )
+    if segment.get("words"):
+        segment["words"] = [
+            dict(word, start=round(word["start"] + offset, 3), end=round(word["end"] + offset, 3))
+            for word in segment["words"]
+        ]
+    return segment
+
+def split_transcription(audio, model_id, prompt, language, client, word_timestamps=False, beam_size=None, need_segments=True):
+    """
+    Transcribe long audio as chunks on all workers at once
+
+    Returns the info and a generator of the stitched segments, in order,
+    with ids and timestamps relative to the whole recording.
+    """
+    cuts = split_points(audio, worker_pool.size)
+    chunks = [
+        (start / SAMPLE_RATE, submit_job(audio[start:end], model_id, prompt, language, client, word_timestamps, beam_size, need_segments))
+        for start, end in zip(cuts, cuts[1:])
+    ]
+    info, first_segments = read_messages(chunks[0][1])
+
+    def segments():
+        segment_id = 0
+        for index, (offset, messages) in enumerate(chunks):
+            chunk_segments = first_segments if index == 0 else read_messages(messages)[1]
+            for segment in chunk_segments:
+                yield shift_segment(segment, segment_id, offset)
+                segment_id += 1
+
+    return {"language": info["language"], "duration": len(audio) / SAMPLE_RATE}, segments()
+
+def transcribe_audio(audio, model_id="whisper-1", prompt=None, language=None, client=None, word_timestamps=False, beam_size=None, need_segments=True):
+    """
+    Transcribe audio using selected whisper model
+    """
+    info, segments = iter_segments(audio, model_id, prompt, language, client, word_timestamps, beam_size, need_segments)
+
+    # Decode all segments in a single pass
+    segments = list(segments)
 
     # Match OpenAI Whisper API format
     return {
-        "text": full_text,
+        "text": "".join(segment["text"] for segment in segments).strip(),
         "task": "transcribe",
-        "language": info.language,
-        "duration": sum(segment.end - segment.start for segment in segments),
-        "segments": [
-            {
-                "id": i,
-                "seek": segment.start * 1000,
-                "start": segment.start,
-                "end": segment.end,
-                "text": segment.text,
-                "tokens": [],
-                "temperature": 0.0,
-                "avg_logprob": -1.0,
-                "compression_ratio": 1.0,
-                "no_speech_prob": 0.0 if not hasattr(segment, 'no_speech_prob') else segment.no_speech_prob
-            }
-            for i, segment in enumerate(segments)
-        ]
+        "language": info["language"],
+        "duration": info["duration"],
+        "segments": segments
     }
 
+def stream_transcription(audio, model_id="whisper-1", prompt=None, language=None, client=None, word_timestamps=False, beam_size=None):
+    """
+    Yield server-sent events as segments are decoded
+
+    Each segment is sent as a transcript.text.delta event carrying the
+    segment, followed by a transcript.text.done event with the full text.
+    """
+    info, segments = iter_segments(audio, model_id, prompt, language, client, word_timestamps, beam_size)
+    texts = []
+    for segment in segments:
+        texts.append(segment["text"])
+        yield sse_event({
+            "type": "transcript.text.delta",
+            "delta": segment["text"],
+            "segment": segment
+        })
+    yield sse_event({
+        "type": "transcript.text.done",
+        "text": "".join(texts).strip(),
+        "language": info["language"],
+        "duration": info["duration"]
+    })
+
+def sse_event(payload):
+    """Format a server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def format_timestamp(seconds, separator):
+    """Format seconds as HH:MM:SS with milliseconds after separator"""
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+def format_subtitles(segments, response_format):
+    """Render segments as SRT or WebVTT cues"""
+    separator = "," if response_format == "srt" else "."
+    cues = []
+    for index, segment in enumerate(segments, 1):
+        timing = f"{format_timestamp(segment['start'], separator)} --> {format_timestamp(segment['end'], separator)}"
+        cue = f"{timing}\n{segment['text'].strip()}\n"
+        cues.append(f"{index}\n{cue}" if response_format == "srt" else cue)
+    header = "WEBVTT\n\n" if response_format == "vtt" else ""
+    return header + "\n".join(cues)
+
+def format_response(result, response_format="json", granularities=("segment",)):
+    """
+    Shape a transcription into the requested OpenAI response format
+
+    verbose_json lists segments and/or words according to granularities.
+    """
+    if response_format == "json":
+        return jsonify({"text": result["text"]})
+    if response_format == "text":
+        return Response(result["text"], mimetype=RESPONSE_FORMATS["text"])
+    if response_format in ("srt", "vtt"):
+        return Response(format_subtitles(result["segments"], response_format), mimetype=RESPONSE_FORMATS[response_format])
+
+    segments = result["segments"]
+    verbose = {key: value for key, value in result.items() if key != "segments"}
+    if "word" in granularities:
+        verbose["words"] = [word for segment in segments for word in segment.get("words", [])]
+    if "segment" in granularities:
+        verbose["segments"] = [
+            {key: value for key, value in segment.items() if key != "words"}
+            for segment in segments
+        ]
+    return jsonify(verbose)
+
+def worker_main(worker_id, cpu_threads, memory_budget_mb, task_queue, result_queue):
+    """
+    Transcription worker process
+
+    Loads its own models, then runs batches of jobs from task_queue and
+    reports ("info" | "segment" | "done" | "error" | "stats") messages on
+    result_queue. Batches of more than one job are transcribed together where
+    possible and the rest one at a time.
+    """
+    global CPU_THREADS
+    CPU_THREADS = cpu_threads
+    model_pool.budget_mb = memory_budget_mb
+
+    def report_stats():
+        result_queue.put((worker_id, None, "stats", {
+            "pid": os.getpid(),
+            "preload": dict(preload_state),
+            "model_pool": model_pool.snapshot()
+        }))
+
+    preload_models()
+    report_stats()
+
+    while True:
+        batch = task_queue.get()
+        if batch is None:
+            break
+
+        results = {}
+        if len(batch) > 1:
+            try:
+                results = transcribe_batch(batch)
+            except Exception as e:
+                logger.warning(f"Batched transcription failed, transcribing one at a time: {e}")
+
+        for job in batch:
+            run_job(worker_id, job, results.get(job["id"]), result_queue)
+        report_stats()
+
+def run_job(worker_id, job, result, result_queue):
+    """Report a batched result, or transcribe the job on its own"""
+    try:
+        if result is None:
+            result = decode_segments(
+                job["audio"], job["model"], job["prompt"], job["language"],
+                job["word_timestamps"], job["beam_size"]
+            )
+        info, segments = result
+        result_queue.put((worker_id, job["id"], "info", info))
+        for segment in segments:
+            result_queue.put((worker_id, job["id"], "segment", segment))
+        result_queue.put((worker_id, job["id"], "done", None))
+    except Exception as e:
+        result_queue.put((worker_id, job["id"], "error", str(e)))
+
+
+class TranscriptionPool:
+    """
+    Run transcriptions on a pool of worker processes.
+
+    Jobs are queued per client and handed out round-robin across clients,
+    so a client submitting many files does not hold up everyone else. Each
+    idle worker gets a batch of up to BATCH_MAX_SIZE short jobs for the same
+    model, dispatched once it is full or its oldest job has waited
+    BATCH_MAX_WAIT. Queued jobs are shared out between the idle workers, and
+    jobs longer than BATCH_MAX_DURATION always run on their own.
+    """
+
+    def __init__(self, size, cpu_threads, memory_budget_mb):
+        self.size = size
+        self.cpu_threads = cpu_threads
+        self.memory_budget_mb = memory_budget_mb
+        self.context = multiprocessing.get_context("spawn")
+        self.result_queue = self.context.Queue()
+        self.workers = {}
+        self.pending = OrderedDict()
+        self.jobs = {}
+        self.job_ids = itertools.count()
+        self.condition = threading.Condition()
+
+    def start(self):
+        with self.condition:
+            for worker_id in range(self.size):
+                self.start_worker(worker_id)
+        threading.Thread(target=self.collect, daemon=True).start()
+        threading.Thread(target=self.dispatch, daemon=True).start()
+        logger.info(
+            f"Started {self.size} transcription workers with {self.cpu_threads} threads "
+            f"and {self.memory_budget_mb} MB for models each"
+        )
+
+    def start_worker(self, worker_id):
+        """Start (or restart) a worker process (lock held)"""
+        task_queue = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main,
+            args=(worker_id, self.cpu_threads, self.memory_budget_mb, task_queue, self.result_queue),
+            daemon=True
+        )
+        process.start()
+        self.workers[worker_id] = {
+            "process": process,
+            "task_queue": task_queue,
+            "batch": set(),
+            "jobs": 0,
+            "batches": 0,
+            "stats": {}
+        }
+
+    def submit(self, job, client=None):
+        """Queue a job and return the queue its messages will arrive on"""
+        messages = queue.Queue()
+        with self.condition:
+            job = dict(job, id=next(self.job_ids), submitted=time.monotonic())
+            self.jobs[job["id"]] = messages
+            self.pending.setdefault(client, deque()).append(job)
+            self.condition.notify_all()
+        return messages
+
+    def next_job(self):
+        """Take the next job, cycling through clients (lock held)"""
+        client, jobs = next(iter(self.pending.items()))
+        job = jobs.popleft()
+        del self.pending[client]
+        if jobs:
+            self.pending[client] = jobs
+        return job
+
+    @staticmethod
+    def batchable(job):
+        return (
+            len(job["audio"]) <= BATCH_MAX_DURATION * SAMPLE_RATE
+            and not job["word_timestamps"]
+            and not job["need_segments"]
+        )
+
+    def next_batch(self, limit):
+        """Take the next job and more short jobs like it, cycling through clients (lock held)"""
+        batch = [self.next_job()]
+        model, beam_size = batch[0]["model"], batch[0]["beam_size"]
+        if not self.batchable(batch[0]):
+            return batch
+        while len(batch) < limit:
+            client = next((
+                client for client, jobs in self.pending.items()
+                if jobs[0]["model"] == model and jobs[0]["beam_size"] == beam_size and self.batchable(jobs[0])
+            ), None)
+            if client is None:
+                break
+            jobs = self.pending.pop(client)
+            batch.append(jobs.popleft())
+            if jobs:
+                self.pending[client] = jobs
+        return batch
+
+    def batch_wait(self):
+        """Seconds until the pending jobs should be dispatched (lock held)"""
+        jobs = [job for jobs in self.pending.values() for job in jobs]
+        if len(jobs) >= BATCH_MAX_SIZE or not self.batchable(jobs[0]):
+            return 0
+        oldest = min(job["submitted"] for job in jobs)
+        return oldest + BATCH_MAX_WAIT - time.monotonic()
+
+    def check_workers(self):
+        """Fail the jobs of crashed workers and restart them (lock held)"""
+        for worker_id, worker in list(self.workers.items()):
+            if worker["process"].is_alive():
+                continue
+            logger.error(f"Transcription worker {worker_id} exited, restarting")
+            for job_id in worker["batch"]:
+                messages = self.jobs.pop(job_id, None)
+                if messages:
+                    messages.put(("error", "Transcription worker crashed"))
+            self.start_worker(worker_id)
+
+    def dispatch(self):
+        with self.condition:
+            while True:
+                idle = [worker for worker in self.workers.values() if not worker["batch"]]
+                if not idle or not self.pending:
+                    self.condition.wait(1.0)
+                    self.check_workers()
+                    continue
+
+                # Give concurrent requests a moment to join the batch
+                wait = self.batch_wait()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                # Share the queued jobs out between the idle workers
+                queued = sum(len(jobs) for jobs in self.pending.values())
+                batch = self.next_batch(min(BATCH_MAX_SIZE, math.ceil(queued / len(idle))))
+                worker = idle[0]
+                worker["batch"] = {job["id"] for job in batch}
+                worker["jobs"] += len(batch)
+                worker["batches"] += 1
+                worker["task_queue"].put(batch)
+
+    def collect(self):
+        while True:
+            worker_id, job_id, kind, payload = self.result_queue.get()
+            with self.condition:
+                worker = self.workers[worker_id]
+                if kind == "stats":
+                    worker["stats"] = payload
+                    continue
+                messages = self.jobs.get(job_id)
+                if kind in ("done", "error"):
+                    self.jobs.pop(job_id, None)
+                    worker["batch"].discard(job_id)
+                    self.condition.notify_all()
+            if messages:
+                messages.put((kind, payload))
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "size": self.size,
+                "cpu_threads": self.cpu_threads,
+                "batch_max_size": BATCH_MAX_SIZE,
+                "batch_max_wait": BATCH_MAX_WAIT,
+                "queued": sum(len(jobs) for jobs in self.pending.values()),
+                "workers": [
+                    {
+                        "id": worker_id,
+                        "alive": worker["process"].is_alive(),
+                        "busy": bool(worker["batch"]),
+                        "jobs": worker["jobs"],
+                        "batches": worker["batches"],
+                        **worker["stats"]
+                    }
+                    for worker_id, worker in self.workers.items()
+                ]
+            }
+
+
+worker_pool = None
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="decode")
+
+def decode_upload(file):
+    """Decode an uploaded file to 16 kHz mono float32 samples on the decode pool"""
+    return decode_pool.submit(decode_audio, file.stream, sampling_rate=SAMPLE_RATE).result()
+
+def client_id():
+    """Identify the requesting client, looking through the cloudflared tunnel"""
+    forwarded = request.headers.get('CF-Connecting-IP') or request.headers.get('X-Forwarded-For', '')
+    return forwarded.split(',')[0].strip() or request.remote_addr
+
 @app.route('/whisper/v1/audio/transcriptions', methods=['POST'])
 def handle_transcription():
     try:
@@ -108,9 +1070,16 @@ def handle_transcription():
             }), 400
 
         file = request.files['file']
-        model = request.form.get('model', 'whisper-1')
+        model = resolve_model_id(request.form.get('model', 'whisper-1'))
         prompt = request.form.get('prompt', None)
         language = request.form.get('language', None)
+        response_format = request.form.get('response_format', 'json')
+        granularities = (
+            request.form.getlist('timestamp_granularities[]')
+            or request.form.getlist('timestamp_granularities')
+            or ['segment']
+        )
+        beam_size = request.form.get('beam_size', None)
 
         if model not in MODELS:
             return jsonify({
@@ -121,16 +1090,73 @@ def handle_transcription():
                 }
             }), 400
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            file.save(temp_file.name)
-            temp_path = temp_file.name
+        if response_format not in RESPONSE_FORMATS:
+            return jsonify({
+                "error": {
+                    "message": f"response_format must be one of {', '.join(RESPONSE_FORMATS)}",
+                    "type": "invalid_request_error",
+                    "code": "invalid_response_format"
+                }
+            }), 400
+
+        if any(granularity not in TIMESTAMP_GRANULARITIES for granularity in granularities):
+            return jsonify({
+                "error": {
+                    "message": f"timestamp_granularities must be among {', '.join(TIMESTAMP_GRANULARITIES)}",
+                    "type": "invalid_request_error",
+                    "code": "invalid_timestamp_granularities"
+                }
+            }), 400
+
+        if beam_size is not None:
+            if not beam_size.isdigit() or not 1 <= int(beam_size) <= MAX_BEAM_SIZE:
+                return jsonify({
+                    "error": {
+                        "message": f"beam_size must be between 1 and {MAX_BEAM_SIZE}",
+                        "type": "invalid_request_error",
+                        "code": "invalid_beam_size"
+                    }
+                }), 400
+            beam_size = int(beam_size)
+
+        # Word alignment is only worth its cost when the words are returned
+        word_timestamps = response_format == "verbose_json" and "word" in granularities
 
         try:
-            result = transcribe_audio(temp_path, model, prompt, language)
-            return jsonify(result), 200
-        finally:
-            os.unlink(temp_path)
+            audio = decode_upload(file)
+        except Exception as e:
+            return jsonify({
+                "error": {
+                    "message": f"Could not decode audio file: {e}",
+                    "type": "invalid_request_error",
+                    "code": "invalid_file"
+                }
+            }), 400
+
+        client = client_id()
 
+        if request.form.get('stream', 'false').lower() == 'true':
+            def generate():
+                try:
+                    yield from stream_transcription(audio, model, prompt, language, client, word_timestamps, beam_size)
+                except Exception as e:
+                    yield sse_event({"type": "error", "error": {"message": str(e), "type": "internal_error"}})
+
+            return Response(generate(), mimetype='text/event-stream')
+
+        # Subtitles and verbose_json need real segments, so can't be batched
+        need_segments = response_format in ("verbose_json", "srt", "vtt")
+        result = transcribe_audio(audio, model, prompt, language, client, word_timestamps, beam_size, need_segments)
+        return format_response(result, response_format, granularities), 200
+
+    except RequestEntityTooLarge:
+        return jsonify({
+            "error": {
+                "message": f"Request body exceeds {UPLOAD_MAX_BYTES // (1024 * 1024)} MB",
+                "type": "invalid_request_error",
+                "code": "file_too_large"
+            }
+        }), 413
     except Exception as e:
         return jsonify({
             "error": {
@@ -167,6 +1193,432 @@ def health_check():
     return jsonify({
         "status": "operational",
         "message": "Whisper API is healthy",
-        "available_models": list(MODELS.keys())
+        "available_models": list(MODELS.keys()),
+        "tuning": tuning,
+        "transcription_cache": transcription_cache.snapshot(),
+        **(
+            {"worker_pool": worker_pool.snapshot()} if worker_pool else
+            {"preload": preload_state, "model_pool": model_pool.snapshot()}
+        )
     })
-app.run(host='0.0.0.0', port=3401)
+
+class FrameDecoder:
+    """
+    Decode WebSocket audio frames to 16 kHz mono float32 samples.
+
+    Frames are either raw little-endian 16-bit PCM at sample_rate or raw
+    Opus packets, one per frame.
+    """
+
+    ENCODINGS = ("pcm16", "opus")
+
+    def __init__(self, encoding="pcm16", sample_rate=SAMPLE_RATE):
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.codec = av.CodecContext.create("opus", "r") if encoding == "opus" else None
+        self.resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+
+    def resample(self, frames):
+        samples = [
+            resampled.to_ndarray().reshape(-1)
+            for frame in frames
+            for resampled in self.resampler.resample(frame)
+        ]
+        return np.concatenate(samples) if samples else np.zeros(0, dtype=np.float32)
+
+    def decode(self, data):
+        if self.codec:
+            return self.resample(self.codec.decode(av.Packet(data)))
+
+        pcm = np.frombuffer(data[:len(data) // 2 * 2], dtype="<i2")
+        if self.sample_rate == SAMPLE_RATE:
+            return pcm.astype(np.float32) / 32768.0
+        frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = self.sample_rate
+        return self.resample([frame])
+
+
+class RealtimeSession:
+    """
+    Transcribe audio as it is recorded, one utterance at a time.
+
+    Samples are buffered until the end of an utterance is found by VAD.
+    Each step returns the events to send: a partial hypothesis while the
+    user is speaking and a final one when the utterance ends. Transcription
+    goes through the worker pool (or the in-process models) like uploads.
+    """
+
+    def __init__(self, model_id, prompt=None, language=None, client=None):
+        self.model_id = model_id
+        self.prompt = prompt
+        self.language = language
+        self.client = client
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0.0
+        self.unchecked = 0
+        self.texts = []
+
+    def feed(self, samples):
+        """Add samples, returning True once a step is due"""
+        self.buffer = np.concatenate([self.buffer, samples])
+        self.unchecked += len(samples)
+        return self.unchecked >= REALTIME_STEP * SAMPLE_RATE
+
+    def transcribe(self, audio, need_segments=True):
+        info, segments = start_transcription(
+            audio, self.model_id, self.prompt, self.language, self.client, need_segments=need_segments
+        )
+        segments = list(segments)
+        return info, segments, "".join(segment["text"] for segment in segments).strip()
+
+    def step(self, final=False):
+        """Look for the end of the utterance and transcribe it (blocking)"""
+        self.unchecked = 0
+        speech = get_speech_timestamps(self.buffer, VadOptions(**VAD_PARAMETERS)) if len(self.buffer) else []
+        if not speech:
+            # Only keep enough silence to catch the start of the next utterance
+            keep = int(REALTIME_END_SILENCE * SAMPLE_RATE)
+            if len(self.buffer) > keep:
+                self.offset += (len(self.buffer) - keep) / SAMPLE_RATE
+                self.buffer = self.buffer[-keep:]
+            return []
+
+        silence = (len(self.buffer) - speech[-1]["end"]) / SAMPLE_RATE
+        full = len(self.buffer) >= REALTIME_MAX_UTTERANCE * SAMPLE_RATE
+        if not (final or full or silence >= REALTIME_END_SILENCE):
+            # Partial hypotheses only send the text, so they may be batched
+            _, _, text = self.transcribe(self.buffer, need_segments=False)
+            return [{"type": "transcript.text.partial", "text": text}] if text else []
+
+        end = len(self.buffer) if final or full else speech[-1]["end"]
+        info, segments, text = self.transcribe(self.buffer[:end])
+        event = {
+            "type": "transcript.text.final",
+            "text": text,
+            "start": round(self.offset + speech[0]["start"] / SAMPLE_RATE, 3),
+            "end": round(self.offset + min(end, speech[-1]["end"]) / SAMPLE_RATE, 3),
+            "language": info["language"],
+            "segments": segments
+        }
+        self.offset += end / SAMPLE_RATE
+        self.buffer = self.buffer[end:]
+        # Keep the detected language for the rest of the session
+        self.language = self.language or info["language"]
+        if not text:
+            return []
+        self.texts.append(text)
+        return [event]
+
+    def finish(self):
+        """Finalize the last utterance and return the closing events (blocking)"""
+        events = self.step(final=True)
+        return events + [{"type": "transcript.text.done", "text": " ".join(self.texts)}]
+
+
+async def realtime_transcription(scope, receive, send):
+    """
+    Serve a real-time transcription WebSocket.
+
+    Query parameters select the model, language, prompt, encoding (pcm16 or
+    opus) and sample_rate of pcm16 audio. Binary messages carry audio; a
+    {"type": "stop"} text message finalizes the last utterance and closes.
+    """
+    params = {key: values[0] for key, values in parse_qs(scope["query_string"].decode()).items()}
+    model = resolve_model_id(params.get("model", "whisper-1"))
+    encoding = params.get("encoding", "pcm16")
+    try:
+        sample_rate = int(params.get("sample_rate", SAMPLE_RATE))
+    except ValueError:
+        sample_rate = 0
+
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if model not in MODELS or encoding not in FrameDecoder.ENCODINGS or sample_rate <= 0:
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    await send({"type": "websocket.accept"})
+
+    headers = dict(scope["headers"])
+    forwarded = (headers.get(b"cf-connecting-ip") or headers.get(b"x-forwarded-for", b"")).decode()
+    client = forwarded.split(",")[0].strip() or (scope.get("client") or ["websocket"])[0]
+
+    decoder = FrameDecoder(encoding, sample_rate)
+    session = RealtimeSession(model, params.get("prompt"), params.get("language"), client)
+
+    async def send_events(events):
+        for event in events:
+            await send({"type": "websocket.send", "text": json.dumps(event)})
+
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                if session.feed(await asyncio.to_thread(decoder.decode, message["bytes"])):
+                    await send_events(await asyncio.to_thread(session.step))
+            elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                await send_events(await asyncio.to_thread(session.finish))
+                await send({"type": "websocket.close", "code": 1000})
+                return
+    except Exception as e:
+        logger.error(f"Real-time transcription failed: {e}")
+        await send_events([{"type": "error", "error": {"message": str(e), "type": "internal_error"}}])
+        await send({"type": "websocket.close", "code": 1011})
+
+
+def dispatch_request(flask_app, environ):
+    """Run a request through a Flask app, returning its response"""
+    with flask_app.request_context(environ):
+        return flask_app.make_response(flask_app.full_dispatch_request())
+
+
+async def send_upload_too_large(send):
+    body = json.dumps({
+        "error": {
+            "message": f"Request body exceeds {UPLOAD_MAX_BYTES // (1024 * 1024)} MB",
+            "type": "invalid_request_error",
+            "code": "file_too_large"
+        }
+    }).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"connection", b"close")]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def threaded_request(flask_app, scope, receive, send):
+    """
+    Serve an HTTP request with a Flask app on a thread of its own
+
+    WsgiToAsgi runs every request on one shared thread, one at a time, so
+    long-running routes are served this way to overlap with each other.
+    """
+    # The body stays in memory like the uploads parsed from it, and is
+    # refused before it is read in full when it is over the upload limit
+    with io.BytesIO() as body:
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            more_body = message.get("more_body", False)
+            if body.tell() > UPLOAD_MAX_BYTES:
+                return await send_upload_too_large(send)
+        body.seek(0)
+
+        adapter = WsgiToAsgiInstance(flask_app)
+        adapter.scope = scope
+        environ = adapter.build_environ(scope, body)
+        response = await asyncio.to_thread(dispatch_request, flask_app, environ)
+
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in response.headers.items()
+        ]
+    })
+    # Streamed responses are produced as they are read, so off the event loop
+    chunks = response.iter_encoded()
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        await asyncio.to_thread(response.close)
+    await send({"type": "http.response.body", "body": b""})
+
+
+def create_asgi_app(flask_app=None):
+    """
+    Create an ASGI application for the STT server
+
+    WebSocket connections to /whisper/v1/audio/transcriptions/realtime are
+    served natively and transcription requests each on a thread of their
+    own; every other route is passed through to the Flask app.
+    """
+    flask_app = flask_app or app
+    fallback = WsgiToAsgi(flask_app)
+
+    async def asgi_app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] == "websocket":
+            if scope["path"] == "/whisper/v1/audio/transcriptions/realtime":
+                return await realtime_transcription(scope, receive, send)
+            await receive()
+            return await send({"type": "websocket.close", "code": 1008})
+
+        if scope["path"] == "/whisper/v1/audio/transcriptions":
+            return await threaded_request(flask_app, scope, receive, send)
+        await fallback(scope, receive, send)
+
+    return asgi_app
+
+
+def benchmark_config(model_id, compute_type, cpu_threads, audio, runs, results):
+    """Benchmark one configuration (run in a fresh process)"""
+    try:
+        # Unix only; peak memory isn't reported on Windows
+        import resource
+    except ImportError:
+        resource = None
+
+    try:
+        start = time.perf_counter()
+        model = load_model(MODELS[model_id]["size"], compute_type, cpu_threads)
+        load_seconds = time.perf_counter() - start
+
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            segments, _ = model.transcribe(
+                audio,
+                beam_size=default_beam_size(model_id),
+                vad_filter=True,
+                vad_parameters=VAD_PARAMETERS,
+                temperature=0.0,
+                condition_on_previous_text=False
+            )
+            text = "".join(segment.text for segment in segments)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        results.put({
+            "rtf": round(best / (len(audio) / SAMPLE_RATE), 4),
+            "load_seconds": round(load_seconds, 3),
+            # ru_maxrss is in kilobytes on Linux
+            "memory_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024) if resource else None,
+            "text": text.strip()
+        })
+    except Exception as e:
+        results.put({"error": str(e)})
+
+
+def benchmark_sample(path):
+    """Load the benchmark audio, reading the sample text aloud with edge-tts the first time"""
+    if path is None:
+        path = BENCHMARK_SAMPLE
+        if not os.path.exists(path):
+            import edge_tts
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            asyncio.run(edge_tts.Communicate(BENCHMARK_TEXT, "en-US-AriaNeural").save(path))
+    return decode_audio(path, sampling_rate=SAMPLE_RATE)
+
+
+def run_benchmark(argv):
+    """
+    Benchmark models across compute types and thread counts
+
+    Each configuration runs in its own process so memory is measured
+    separately. The fastest configuration per model is saved to TUNING_PATH
+    for this host and used by get_model from then on.
+    """
+    model_device = device()
+    cpu_count = os.cpu_count() or 1
+    thread_counts = sorted({n for n in (1, 2, 4, 8, 16, 32) if n < cpu_count} | {cpu_count})
+    compute_types = sorted(
+        {"float32", "int8", "int8_float32", "float16", "int8_float16"}
+        & ctranslate2.get_supported_compute_types(model_device)
+    )
+
+    parser = argparse.ArgumentParser(prog="stt01.py benchmark", description=run_benchmark.__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", nargs="+", default=PRELOAD_MODELS, choices=list(MODELS))
+    parser.add_argument("--compute-types", nargs="+", default=compute_types)
+    parser.add_argument("--threads", nargs="+", type=int, default=thread_counts)
+    parser.add_argument("--audio", help="audio file to transcribe (default: a generated English sample)")
+    parser.add_argument("--runs", type=int, default=2, help="transcriptions per configuration, the fastest counts")
+    args = parser.parse_args(argv)
+
+    audio = benchmark_sample(args.audio)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    best = {}
+
+    print(f"Benchmarking on {len(audio) / SAMPLE_RATE:.1f}s of audio ({host_key()})")
+    for model_id in args.models:
+        for compute_type in args.compute_types:
+            # Thread count only matters on the CPU
+            for cpu_threads in (args.threads if model_device == "cpu" else [CPU_THREADS]):
+                process = context.Process(
+                    target=benchmark_config,
+                    args=(model_id, compute_type, cpu_threads, audio, args.runs, results)
+                )
+                process.start()
+                # The process can die without a result, e.g. when it is OOM killed
+                result = None
+                while result is None:
+                    try:
+                        result = results.get(timeout=1)
+                    except queue.Empty:
+                        if not process.is_alive():
+                            break
+                if result is None:
+                    try:
+                        result = results.get(timeout=1)
+                    except queue.Empty:
+                        result = {"error": f"process exited with code {process.exitcode}"}
+                process.join()
+
+                label = f"{model_id:>9} {compute_type:>13} {cpu_threads:>3} threads"
+                if "error" in result:
+                    print(f"{label}  failed: {result['error']}")
+                    continue
+                print(f"{label}  rtf {result['rtf']:.3f}  load {result['load_seconds']:.1f}s  {result['memory_mb'] or '?'} MB")
+                if model_id not in best or result["rtf"] < best[model_id]["rtf"]:
+                    best[model_id] = {
+                        "compute_type": compute_type,
+                        "cpu_threads": cpu_threads,
+                        "rtf": result["rtf"],
+                        "memory_mb": result["memory_mb"],
+                        "benchmarked_at": time.time()
+                    }
+
+    try:
+        with open(TUNING_PATH) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    saved.setdefault(host_key(), {}).update(best)
+    os.makedirs(os.path.dirname(TUNING_PATH), exist_ok=True)
+    with open(TUNING_PATH, "w") as f:
+        json.dump(saved, f, indent=2)
+
+    for model_id, config in best.items():
+        print(f"Best for {model_id}: {config['compute_type']} with {config['cpu_threads']} threads (rtf {config['rtf']:.3f})")
+    print(f"Saved to {TUNING_PATH}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["benchmark"]:
+        run_benchmark(sys.argv[2:])
+        sys.exit()
+
+    if TRANSCRIPTION_CACHE_ENABLED:
+        transcription_cache.load()
+
+    if TRANSCRIPTION_WORKERS > 0:
+        worker_pool = TranscriptionPool(
+            TRANSCRIPTION_WORKERS,
+            max(1, (os.cpu_count() or 1) // TRANSCRIPTION_WORKERS),
+            MODEL_MEMORY_BUDGET_MB // TRANSCRIPTION_WORKERS
+        )
+        worker_pool.start()
+    else:
+        threading.Thread(target=preload_models, daemon=True).start()
+
+    import uvicorn
+    uvicorn.run(create_asgi_app(), host='0.0.0.0', port=3401)
+
@@ -0,0 +1,242 @@
+import os
+import signal
+import subprocess
+import threading
+import logging
+import time
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Child:
+    """
+    A supervised child process.
+
+    health_url, when given, is probed with GET; any response below 500
+    counts as healthy. A probe that times out means the child is alive but
+    busy, and never gets it restarted. Children without one are only
+    checked for being alive. on_start is called with each new process, and
+    makes its stdout and stderr pipes.
+    """
+
+    def __init__(self, name, command, health_url=None, on_start=None, startup_grace=None):
+        self.name = name
+        self.command = command
+        self.health_url = health_url
+        self.on_start = on_start
+        self.startup_grace = startup_grace
+        self.process = None
+        self.started_at = None
+        self.healthy = False
+        self.health_failures = 0
+        self.failures = 0
+        self.restarts = 0
+        self.restart_at = None
+        self.last_error = None
+
+
+class Supervisor:
+    """
+    Own the child processes: start them, probe their health, restart them
+    with exponential backoff when they exit or stop responding, and shut
+    them all down on exit.
+
+    Children run in their own process group (session), so shutting one
+    down also stops anything it started.
+    """
+
+    CHECK_INTERVAL = 5
+    HEALTH_TIMEOUT = 5
+    # Consecutive failed probes (refused or 5xx) before a running child is
+    # restarted
+    HEALTH_FAILURES = 3
+    # Time a child gets to come up before failed probes count
+    STARTUP_GRACE = 120
+    # Restart delays double from BACKOFF_BASE up to BACKOFF_MAX, and reset
+    # once a child has stayed up for BACKOFF_RESET seconds
+    BACKOFF_BASE = 1
+    BACKOFF_MAX = 60
+    BACKOFF_RESET = 60
+    SHUTDOWN_TIMEOUT = 10
+
+    def __init__(self):
+        self.children = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def add(self, child):
+        """Start a child and supervise it from now on"""
+        with self.lock:
+            self.children[child.name] = child
+            self.spawn(child)
+        return child
+
+    def start(self):
+        """Start the health check loop"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def spawn(self, child):
+        """Start (or restart) a child's process (lock held)"""
+        pipes = subprocess.PIPE if child.on_start else None
+        try:
+            child.process = subprocess.Popen(
+                child.command,
+                stdout=pipes,
+                stderr=pipes,
+                start_new_session=os.name != 'nt'
+            )
+        except OSError as e:
+            child.process = None
+            child.last_error = str(e)
+            logger.error(f"Failed to start {child.name}: {e}")
+            self.schedule_restart(child)
+            return
+        child.started_at = time.monotonic()
+        child.healthy = False
+        child.health_failures = 0
+        child.restart_at = None
+        logger.info(f"Started {child.name} (pid {child.process.pid})")
+        if child.on_start:
+            child.on_start(child.process)
+
+    def schedule_restart(self, child):
+        """Restart a child after its backoff delay (lock held)"""
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** child.failures)
+        child.healthy = False
+        child.failures += 1
+        child.restarts += 1
+        child.restart_at = time.monotonic() + delay
+        logger.warning(f"Restarting {child.name} in {delay}s ({child.last_error})")
+
+    def probe(self, child):
+        """Probe a child's health: "ok", "failed", or "timeout" when it is busy"""
+        try:
+            with urllib.request.urlopen(child.health_url, timeout=self.HEALTH_TIMEOUT) as response:
+                return "ok" if response.status < 500 else "failed"
+        except urllib.error.HTTPError as e:
+            return "ok" if e.code < 500 else "failed"
+        except urllib.error.URLError as e:
+            return "timeout" if isinstance(e.reason, TimeoutError) else "failed"
+        except TimeoutError:
+            return "timeout"
+        except (OSError, ValueError):
+            return "failed"
+
+    def check(self, child, result=None):
+        """Check one child against its probe result, restarting it if it is due"""
+        with self.lock:
+            now = time.monotonic()
+            if child.restart_at is not None:
+                if now >= child.restart_at:
+                    self.spawn(child)
+                return
+
+            code = child.process.poll()
+            if code is not None:
+                child.last_error = f"exited with code {code}"
+                self.schedule_restart(child)
+                return
+
+            if child.healthy and now - child.started_at >= self.BACKOFF_RESET:
+                child.failures = 0
+            if not child.health_url:
+                child.healthy = True
+                return
+
+            if result == "ok":
+                child.healthy = True
+                child.health_failures = 0
+                return
+            if result == "timeout":
+                # Alive but busy, e.g. with a long transcription
+                child.last_error = "health check timed out"
+                return
+
+            # Failed probes only count once the child has been up or had its grace
+            grace = self.STARTUP_GRACE if child.startup_grace is None else child.startup_grace
+            if not child.healthy and now - child.started_at < grace:
+                return
+            child.health_failures += 1
+            if child.health_failures < self.HEALTH_FAILURES:
+                return
+            child.last_error = f"failed {child.health_failures} health checks"
+
+        self.terminate(child)
+        with self.lock:
+            self.schedule_restart(child)
+
+    def run(self):
+        while not self.stopping.wait(self.CHECK_INTERVAL):
+            with self.lock:
+                children = list(self.children.values())
+                probed = [
+                    child for child in children
+                    if child.health_url and child.restart_at is None
+                    and child.process.poll() is None
+                ]
+            # Probes can take HEALTH_TIMEOUT each, so they run at once and
+            # without the lock, which snapshot() needs
+            results = {}
+            if probed:
+                with ThreadPoolExecutor(max_workers=len(probed)) as pool:
+                    results = dict(zip((child.name for child in probed), pool.map(self.probe, probed)))
+            for child in children:
+                if self.stopping.is_set():
+                    break
+                self.check(child, results.get(child.name))
+
+    def terminate(self, child):
+        """Stop a child's process group, killing it if it doesn't exit in time"""
+        process = child.process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            if os.name == 'nt':
+                process.terminate()
+            else:
+                os.killpg(process.pid, signal.SIGTERM)
+            process.wait(self.SHUTDOWN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{child.name} did not stop in {self.SHUTDOWN_TIMEOUT}s, killing it")
+            if os.name == 'nt':
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        except ProcessLookupError:
+            pass
+
+    def stop(self):
+        """Stop supervising and shut every child down at once"""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+        with self.lock:
+            children = list(self.children.values())
+        if children:
+            with ThreadPoolExecutor(max_workers=len(children)) as pool:
+                list(pool.map(self.terminate, children))
+        logger.info("Stopped all child processes")
+
+    def snapshot(self):
+        """Return the state of every child"""
+        now = time.monotonic()
+        with self.lock:
+            return {
+                name: {
+                    "pid": child.process.pid if child.process else None,
+                    "running": bool(child.process) and child.process.poll() is None,
+                    "healthy": child.healthy,
+                    "restarts": child.restarts,
+                    "uptime": round(now - child.started_at, 1) if child.started_at and child.restart_at is None else None,
+                    "restart_in": round(child.restart_at - now, 1) if child.restart_at is not None else None,
+                    "last_error": child.last_error
+                }
+                for name, child in self.children.items()
+            }
@@ -5,15 +5,25 @@ import asyncio
 import json
 import secrets
 import uuid
+import hashlib
+import unicodedata
+import queue
+import re
+import time
+import heapq
+from bisect import bisect_right
+from functools import lru_cache
+from contextlib import contextmanager
+from itertools import chain
 from datetime import datetime, timedelta
-from threading import Thread
+from threading import Thread, Event, Lock, Condition
 import subprocess
-import util
+import shutil
+import io
 # Third-party imports
-from flask import Flask, request, jsonify, send_file, abort , render_template
+from flask import Flask, Response, request, jsonify, send_file, abort , render_template
 from flask_cors import CORS
-import edge_tts
-from langdetect import detect
+from asgiref.wsgi import WsgiToAsgi
 
 
 class Config:
@@ -23,20 +33,73 @@ class Config:
     DATABASE_PATH = os.path.join(os.getcwd() , "database" , "audio_files.db")
     AUDIO_DIR = os.path.join(os.getcwd() , "res")
     DATA_FOLDER = os.path.join(os.getcwd() , "data")
-    util.make_dir(os.path.join(os.getcwd() , "database"))
-    util.make_dir(AUDIO_DIR)
-    util.make_dir(DATA_FOLDER)
+
+    # Synthesis cache settings
+    CACHE_ENABLED = True
+    CACHE_MAX_BYTES = 512 * 1024 * 1024
+    CACHE_MAX_AGE = timedelta(days=7)
+    # Once over CACHE_MAX_BYTES, the cache is evicted down to this fraction of
+    # it, so the next few entries don't go over again straight away
+    CACHE_LOW_WATER = 0.9
+
+    # Database writer settings: queued writes are committed together, up to
+    # DB_BATCH_SIZE statements or DB_BATCH_INTERVAL seconds after the first
+    DB_BATCH_SIZE = 100
+    DB_BATCH_INTERVAL = 0.05
+    DB_READER_POOL_SIZE = 4
+
+    # Expired files due within CLEANUP_GRACE seconds of each other are deleted
+    # together; the cache is evicted every CACHE_EVICT_INTERVAL seconds, and
+    # as soon as it goes over its size budget when served from one process
+    CLEANUP_GRACE = 1
+    CACHE_EVICT_INTERVAL = 60
+
+    # Streaming settings (clients may override with "stream" in the request)
+    STREAM_RESPONSES = True
+
+    # Edge TTS produces MP3; other response formats are transcoded with ffmpeg
+    DEFAULT_RESPONSE_FORMAT = "mp3"
+    FFMPEG_PATH = "ffmpeg"
+    OPUS_BITRATE = "24k"
+    AAC_BITRATE = "48k"
+    TRANSCODE_CHUNK_SIZE = 4096
+
+    # Keep uncached audio in memory instead of writing it to AUDIO_DIR and
+    # scheduling it for cleanup
+    DISKLESS = True
+
+    # Serving settings: "asgi" serves the TTS endpoints from a shared event
+    # loop with uvicorn, "flask" uses the Flask development server
+    SERVE_MODE = "asgi"
+    ASGI_WORKERS = 1
+    ASGI_LIMIT_CONCURRENCY = 1000
+    MAX_CONCURRENT_SYNTHESES = 256
+
+    # Long inputs are split into chunks of at most this many characters and
+    # synthesized concurrently, at most SYNTH_CONCURRENCY at a time
+    SYNTH_CHUNK_CHARS = 300
+    SYNTH_CONCURRENCY = 4
 
     @classmethod
     def init_directories(cls):
         """Create necessary directories if they don't exist."""
+        os.makedirs(os.path.dirname(cls.DATABASE_PATH), exist_ok=True)
         os.makedirs(cls.DATA_FOLDER, exist_ok=True)
         os.makedirs(cls.AUDIO_DIR, exist_ok=True)
 
-    @staticmethod
-    def load_voice_mappings():
+    # Voice pack, checked for changes at most every VOICE_PACK_CHECK_INTERVAL seconds
+    VOICE_PACK_PATH = os.path.join(os.getcwd() , "open-webui-plus" , "voices" , "voice_pack01.json")
+    VOICE_PACK_CHECK_INTERVAL = 5
+
+    # Language detection settings
+    LANG_DETECT_MAX_CHARS = 400
+    LANG_DETECT_CACHE_SIZE = 1024
+    LANG_DETECT_SEED = 0
+
+    @classmethod
+    def load_voice_mappings(cls):
         """Load voice configuration from JSON file."""
-        with open(os.path.join(os.getcwd() , "open-webui-plus" , "voices" , "voice_pack01.json"), 'r', encoding='utf-8') as f:
+        with open(cls.VOICE_PACK_PATH, 'r', encoding='utf-8') as f:
             return json.load(f)
 
 # Configure logging
@@ -68,13 +131,35 @@ def generate_aes_key(key_length: int = 32) -> bytes:
 # ============================================================================
 
 class DatabaseManager:
-    """Handle database operations for audio files."""
+    """
+    Handle database operations for audio files.
+
+    Writes are queued and committed in batches by a single writer thread that
+    owns a long-lived WAL-mode connection, so request handlers never wait on
+    SQLite commits. Reads use a small pool of reader connections, which WAL
+    mode lets run alongside the writer.
+    """
+
+    write_queue = queue.Queue()
+    writer_thread = None
+    writer_lock = Lock()
+    reader_pool = queue.Queue(maxsize=Config.DB_READER_POOL_SIZE)
+
+    @staticmethod
+    def connect() -> sqlite3.Connection:
+        """Open a connection configured for concurrent use."""
+        conn = sqlite3.connect(Config.DATABASE_PATH, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
 
     @staticmethod
     def init_db():
         """Initialize database with required tables."""
+        Config.init_directories()
         with sqlite3.connect(Config.DATABASE_PATH) as conn:
             cursor = conn.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS files (
                     id TEXT PRIMARY KEY,
@@ -82,18 +167,705 @@ class DatabaseManager:
                     delete_at TIMESTAMP
                 )
             ''')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_files_delete_at ON files (delete_at)'
+            )
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    filename TEXT,
+                    size INTEGER,
+                    created_at TIMESTAMP,
+                    last_access TIMESTAMP
+                )
+            ''')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache (last_access)'
+            )
             conn.commit()
+        DatabaseManager.start_writer()
 
-    @staticmethod
-    def add_file(file_id: str, filename: str, delete_at: datetime):
+    # ------------------------------------------------------------------------
+    # Connection handling
+    # ------------------------------------------------------------------------
+
+    @classmethod
+    def start_writer(cls):
+        """Start the writer thread if it is not already running."""
+        with cls.writer_lock:
+            if cls.writer_thread is None or not cls.writer_thread.is_alive():
+                cls.writer_thread = Thread(target=cls.run_writer, daemon=True)
+                cls.writer_thread.start()
+
+    @classmethod
+    def run_writer(cls):
+        """Commit queued writes in batches of up to Config.DB_BATCH_SIZE."""
+        conn = cls.connect()
+        while True:
+            batch = [cls.write_queue.get()]
+            deadline = time.monotonic() + Config.DB_BATCH_INTERVAL
+            while len(batch) < Config.DB_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(cls.write_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            writes = [item for item in batch if not isinstance(item, Event)]
+            try:
+                with conn:
+                    for sql, params, many in writes:
+                        (conn.executemany if many else conn.execute)(sql, params)
+            except sqlite3.Error as e:
+                # Retry one by one so a single bad statement does not drop the batch
+                logger.error(f"Error committing database batch: {str(e)}")
+                for sql, params, many in writes:
+                    try:
+                        with conn:
+                            (conn.executemany if many else conn.execute)(sql, params)
+                    except sqlite3.Error as e:
+                        logger.error(f"Error executing database write: {str(e)}")
+
+            for item in batch:
+                if isinstance(item, Event):
+                    item.set()
+
+    @classmethod
+    def execute_write(cls, sql: str, params=(), many: bool = False):
+        """Queue a write statement for the writer thread."""
+        cls.start_writer()
+        cls.write_queue.put((sql, params, many))
+
+    @classmethod
+    def flush(cls, timeout: float = None) -> bool:
+        """Wait until all writes queued so far are committed."""
+        cls.start_writer()
+        done = Event()
+        cls.write_queue.put(done)
+        return done.wait(timeout)
+
+    @classmethod
+    @contextmanager
+    def reader(cls):
+        """Borrow a pooled read connection."""
+        try:
+            conn = cls.reader_pool.get_nowait()
+        except queue.Empty:
+            conn = cls.connect()
+        try:
+            yield conn
+        finally:
+            try:
+                cls.reader_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    # ------------------------------------------------------------------------
+    # Records
+    # ------------------------------------------------------------------------
+
+    @classmethod
+    def add_file(cls, file_id: str, filename: str, delete_at: datetime):
         """Add a new file record to the database."""
-        with sqlite3.connect(Config.DATABASE_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO files (id, filename, delete_at) VALUES (?, ?, ?)',
-                (file_id, filename, delete_at)
+        cls.execute_write(
+            'INSERT INTO files (id, filename, delete_at) VALUES (?, ?, ?)',
+            (file_id, filename, delete_at)
+        )
+
+    @classmethod
+    def get_scheduled_files(cls) -> list:
+        """Return (filename, delete_at) for every file awaiting deletion."""
+        with cls.reader() as conn:
+            rows = conn.execute('SELECT filename, delete_at FROM files').fetchall()
+        return [(filename, datetime.fromisoformat(delete_at)) for filename, delete_at in rows]
+
+    @classmethod
+    def remove_files(cls, filenames: list):
+        """Remove file records by filename, using one DELETE per batch."""
+        for i in range(0, len(filenames), Config.DB_BATCH_SIZE):
+            batch = filenames[i:i + Config.DB_BATCH_SIZE]
+            cls.execute_write(
+                f'DELETE FROM files WHERE filename IN ({", ".join("?" * len(batch))})',
+                batch
             )
-            conn.commit()
+
+    @classmethod
+    def get_cache_entry(cls, key: str):
+        """Return the cached filename for a key and mark it as recently used."""
+        with cls.reader() as conn:
+            row = conn.execute('SELECT filename FROM cache WHERE key = ?', (key,)).fetchone()
+        if row:
+            cls.execute_write(
+                'UPDATE cache SET last_access = ? WHERE key = ?',
+                (datetime.now(), key)
+            )
+        return row[0] if row else None
+
+    @classmethod
+    def add_cache_entry(cls, key: str, filename: str, size: int):
+        """Add or replace a cache record."""
+        now = datetime.now()
+        cls.execute_write(
+            'INSERT OR REPLACE INTO cache (key, filename, size, created_at, last_access) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, filename, size, now, now)
+        )
+
+    @classmethod
+    def remove_cache_entries(cls, keys: list):
+        """Remove cache records by key."""
+        cls.execute_write(
+            'DELETE FROM cache WHERE key = ?',
+            [(key,) for key in keys],
+            many=True
+        )
+
+    @classmethod
+    def get_cache_eviction_candidates(cls, max_bytes: int, max_age: timedelta, target_bytes: int = None) -> tuple:
+        """
+        Select cache entries to evict, least recently used first.
+
+        Entries not accessed within max_age are always selected. When the
+        total size is over max_bytes, the remaining entries are selected
+        oldest first until it fits target_bytes (max_bytes by default).
+
+        Returns:
+            tuple: (key, filename) tuples to evict, and the total size in
+                   bytes of the entries that remain
+        """
+        cutoff = datetime.now() - max_age
+        with cls.reader() as conn:
+            rows = conn.execute(
+                'SELECT key, filename, size, last_access < ? FROM cache ORDER BY last_access ASC',
+                (cutoff,)
+            ).fetchall()
+
+        total = sum(size or 0 for _, _, size, _ in rows)
+        target = float('inf')
+        if total > max_bytes:
+            target = max_bytes if target_bytes is None else target_bytes
+        candidates = []
+        for key, filename, size, expired in rows:
+            if total <= target and not expired:
+                break
+            candidates.append((key, filename))
+            total -= size or 0
+        return candidates, total
+
+# ============================================================================
+# Synthesis Cache
+# ============================================================================
+
+class SpeechCache:
+    """
+    Content-addressed cache of synthesized audio, stored in the audio directory.
+
+    A running total of the cached bytes is kept. Storing an entry never
+    touches the cache table itself: once the total goes over
+    Config.CACHE_MAX_BYTES, the cleanup thread is asked for an eviction pass,
+    which trims the cache to Config.CACHE_LOW_WATER of the budget and resets
+    the total from the database.
+    """
+
+    total_bytes = None
+    total_lock = Lock()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize text so equivalent inputs share a cache entry."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, text: str, voice: str, rate: str = None, response_format: str = "mp3") -> str:
+        """
+        Build the cache key for a synthesis request.
+
+        Args:
+            text (str): Input text
+            voice (str): Resolved voice name
+            rate (str, optional): Edge TTS rate adjustment
+            response_format (str, optional): Audio format
+        Returns:
+            str: Hex digest identifying the audio
+        """
+        payload = "\0".join([voice, rate or "", response_format, cls.normalize_text(text)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def lookup(key: str):
+        """
+        Return the path of a cached file, or None on a miss.
+
+        Records whose file has disappeared are dropped.
+        """
+        filename = DatabaseManager.get_cache_entry(key)
+        if filename is None:
+            return None
+
+        path = os.path.join(Config.AUDIO_DIR, filename)
+        if not os.path.exists(path):
+            DatabaseManager.remove_cache_entries([key])
+            return None
+        return path
+
+    @classmethod
+    def store(cls, key: str, filename: str):
+        """Register a synthesized file in the cache and enforce the size budget."""
+        size = os.path.getsize(os.path.join(Config.AUDIO_DIR, filename))
+        DatabaseManager.add_cache_entry(key, filename, size)
+        with cls.total_lock:
+            if cls.total_bytes is not None:
+                cls.total_bytes += size
+            over_budget = cls.total_bytes is None or cls.total_bytes > Config.CACHE_MAX_BYTES
+        if over_budget:
+            CleanupService.request_eviction()
+
+    @classmethod
+    def evict(cls):
+        """
+        Delete least recently used entries that exceed the size or age budget.
+
+        Runs on the cleanup thread, never on a request.
+        """
+        # Queued cache records have to be committed to count
+        DatabaseManager.flush()
+        candidates, total = DatabaseManager.get_cache_eviction_candidates(
+            Config.CACHE_MAX_BYTES,
+            Config.CACHE_MAX_AGE,
+            int(Config.CACHE_MAX_BYTES * Config.CACHE_LOW_WATER)
+        )
+        with cls.total_lock:
+            cls.total_bytes = total
+        if not candidates:
+            return
+
+        for _, filename in candidates:
+            try:
+                os.remove(os.path.join(Config.AUDIO_DIR, filename))
+            except FileNotFoundError:
+                logger.warning(f"Cached file not found for eviction: {filename}")
+        DatabaseManager.remove_cache_entries([key for key, _ in candidates])
+        logger.info(f"Evicted {len(candidates)} cached audio files")
+
+# ============================================================================
+# Audio Formats
+# ============================================================================
+
+class AudioFormats:
+    """OpenAI response_format support on top of Edge TTS's MP3 output."""
+
+    # response_format: (mimetype, file extension, ffmpeg output arguments);
+    # formats without ffmpeg arguments are passed through unchanged
+    FORMATS = {
+        "mp3": ("audio/mpeg", "mp3", None),
+        "opus": ("audio/ogg", "opus", ["-f", "ogg", "-c:a", "libopus", "-b:a", Config.OPUS_BITRATE]),
+        "aac": ("audio/aac", "aac", ["-f", "adts", "-c:a", "aac", "-b:a", Config.AAC_BITRATE]),
+        "flac": ("audio/flac", "flac", ["-f", "flac", "-c:a", "flac"]),
+        "wav": ("audio/wav", "wav", ["-f", "wav", "-c:a", "pcm_s16le"]),
+        "pcm": ("audio/pcm", "pcm", ["-f", "s16le", "-c:a", "pcm_s16le", "-ar", "24000", "-ac", "1"]),
+    }
+
+    @classmethod
+    def get(cls, response_format: str):
+        """Return (mimetype, extension, ffmpeg arguments) for a format, or None."""
+        return cls.FORMATS.get(response_format)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def ffmpeg_available() -> bool:
+        """Check once whether ffmpeg can be found."""
+        return shutil.which(Config.FFMPEG_PATH) is not None
+
+    @classmethod
+    def needs_transcoding(cls, response_format: str) -> bool:
+        """Check whether a format is produced with ffmpeg."""
+        return cls.FORMATS[response_format][2] is not None
+
+    @classmethod
+    async def transcode(cls, audio, response_format: str):
+        """
+        Convert an MP3 chunk stream to response_format as it arrives.
+
+        Args:
+            audio: Async iterator of MP3 data
+            response_format (str): Target format
+        Yields:
+            bytes: Encoded audio data
+        """
+        args = cls.FORMATS[response_format][2]
+        if args is None:
+            async for data in audio:
+                yield data
+            return
+
+        process = await asyncio.create_subprocess_exec(
+            Config.FFMPEG_PATH, '-hide_banner', '-loglevel', 'error',
+            '-f', 'mp3', '-i', 'pipe:0', *args, 'pipe:1',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+
+        async def feed():
+            try:
+                async for data in audio:
+                    process.stdin.write(data)
+                    await process.stdin.drain()
+            finally:
+                process.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while True:
+                data = await process.stdout.read(Config.TRANSCODE_CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+            await feeder
+            if await process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to encode {response_format}")
+        finally:
+            if not feeder.done():
+                feeder.cancel()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+# ============================================================================
+# Speech Synthesis
+# ============================================================================
+
+class SpeechSynthesizer:
+    """Produce audio from Edge TTS, either streamed or saved to disk."""
+
+    SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|(?<=[。！？])|\n+')
+    CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:，；：、])\s*')
+
+    @classmethod
+    def split_text(cls, text: str, max_chars: int = None) -> list:
+        """
+        Split text at sentence or clause boundaries into synthesis chunks.
+
+        Adjacent sentences are merged while they fit in max_chars, so short
+        replies stay a single chunk.
+
+        Args:
+            text (str): Input text
+            max_chars (int, optional): Maximum chunk length
+        Returns:
+            list: Text chunks in reading order
+        """
+        max_chars = max_chars or Config.SYNTH_CHUNK_CHARS
+        if len(text) <= max_chars:
+            return [text]
+
+        pieces = []
+        for sentence in cls.SENTENCE_BOUNDARY.split(text):
+            sentence = sentence.strip()
+            if len(sentence) <= max_chars:
+                pieces.append(sentence)
+                continue
+
+            for clause in cls.CLAUSE_BOUNDARY.split(sentence):
+                clause = clause.strip()
+                while len(clause) > max_chars:
+                    cut = clause.rfind(' ', 0, max_chars)
+                    if cut <= 0:
+                        cut = max_chars
+                    pieces.append(clause[:cut].strip())
+                    clause = clause[cut:].strip()
+                pieces.append(clause)
+
+        chunks = []
+        for piece in filter(None, pieces):
+            if chunks and len(chunks[-1]) + len(piece) + 1 <= max_chars:
+                chunks[-1] = f"{chunks[-1]} {piece}"
+            else:
+                chunks.append(piece)
+        return chunks
+
+    @staticmethod
+    async def stream_chunk(text: str, voice: str, rate: str = None):
+        """
+        Yield audio chunks from Edge TTS as they arrive.
+
+        Args:
+            text (str): Input text
+            voice (str): Voice name
+            rate (str, optional): Edge TTS rate adjustment
+        Yields:
+            bytes: Encoded audio data
+        """
+        # Imported on first use, it pulls in aiohttp
+        import edge_tts
+
+        communicate = edge_tts.Communicate(
+            text,
+            voice=voice,
+            rate=rate if rate is not None else "+0%"
+        )
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+    @classmethod
+    async def stream(cls, text: str, voice: str, rate: str = None):
+        """
+        Yield audio for the full text in order.
+
+        Long text is split with split_text and the chunks are synthesized
+        concurrently, bounded by Config.SYNTH_CONCURRENCY. Audio of the
+        earliest unfinished chunk is passed through as it arrives while later
+        chunks are buffered.
+
+        Args:
+            text (str): Input text
+            voice (str): Voice name
+            rate (str, optional): Edge TTS rate adjustment
+        Yields:
+            bytes: Encoded audio data
+        """
+        chunks = cls.split_text(text)
+        if len(chunks) == 1:
+            async for data in cls.stream_chunk(chunks[0], voice, rate):
+                yield data
+            return
+
+        semaphore = asyncio.Semaphore(Config.SYNTH_CONCURRENCY)
+        buffers = [asyncio.Queue() for _ in chunks]
+
+        async def synthesize(index, chunk):
+            async with semaphore:
+                try:
+                    async for data in cls.stream_chunk(chunk, voice, rate):
+                        await buffers[index].put(data)
+                    await buffers[index].put(None)
+                except Exception as e:
+                    await buffers[index].put(e)
+
+        tasks = [asyncio.create_task(synthesize(i, chunk)) for i, chunk in enumerate(chunks)]
+        try:
+            for buffer in buffers:
+                while True:
+                    item = await buffer.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @classmethod
+    async def stream_to_file(cls, text: str, voice: str, rate: str = None,
+                             output_path: str = None, response_format: str = "mp3"):
+        """
+        Yield audio in response_format, also writing it to output_path when given.
+
+        The file is written under a temporary name and only replaces
+        output_path once the audio is complete.
+        """
+        audio = AudioFormats.transcode(cls.stream(text, voice, rate), response_format)
+        if not output_path:
+            async for data in audio:
+                yield data
+            return
+
+        partial_path = f'{output_path}.{uuid.uuid4().hex}.part'
+        try:
+            with open(partial_path, 'wb') as f:
+                async for data in audio:
+                    f.write(data)
+                    yield data
+            os.replace(partial_path, output_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    @classmethod
+    async def synthesize(cls, text: str, voice: str, rate: str = None,
+                         output_path: str = None, response_format: str = "mp3") -> bytes:
+        """
+        Synthesize the full text in memory.
+
+        Args:
+            text (str): Input text
+            voice (str): Voice name
+            rate (str, optional): Edge TTS rate adjustment
+            output_path (str, optional): File to persist the audio to as well
+            response_format (str, optional): Audio format to produce
+        Returns:
+            bytes: Encoded audio
+        """
+        audio = cls.stream_to_file(text, voice, rate, output_path, response_format)
+        return b''.join([data async for data in audio])
+
+    @classmethod
+    def iter_audio(cls, text: str, voice: str, rate: str = None,
+                   output_path: str = None, on_complete=None, response_format: str = "mp3"):
+        """
+        Synchronously yield audio chunks for a streaming HTTP response.
+
+        Synthesis runs on its own event loop in a background thread so the
+        first chunk can be sent while the rest is still being generated.
+
+        Args:
+            text (str): Input text
+            voice (str): Voice name
+            rate (str, optional): Edge TTS rate adjustment
+            output_path (str, optional): File to write the audio to as well
+            on_complete (callable, optional): Called once all audio has been sent
+            response_format (str, optional): Audio format to produce
+        Yields:
+            bytes: Encoded audio data
+        """
+        chunks = queue.Queue()
+        cancelled = Event()
+
+        async def produce():
+            async for data in cls.stream_to_file(text, voice, rate, output_path, response_format):
+                if cancelled.is_set():
+                    return
+                chunks.put(data)
+
+        def run():
+            try:
+                asyncio.run(produce())
+                chunks.put(None)
+            except Exception as e:
+                chunks.put(e)
+
+        Thread(target=run, daemon=True).start()
+
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"Error streaming speech: {str(item)}")
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+        if on_complete:
+            on_complete()
+
+# ============================================================================
+# Language Detection
+# ============================================================================
+
+class LanguageDetector:
+    """Detect the language of input text for voice selection."""
+
+    # (first code point, last code point, language) for scripts that map to a
+    # single voice pack language; Latin, Cyrillic, Arabic and Devanagari text
+    # is left to langdetect
+    SCRIPT_RANGES = [
+        (0x0370, 0x03FF, 'el'),
+        (0x0590, 0x05FF, 'he'),
+        (0x0980, 0x09FF, 'bn'),
+        (0x0A80, 0x0AFF, 'gu'),
+        (0x0B80, 0x0BFF, 'ta'),
+        (0x0C00, 0x0C7F, 'te'),
+        (0x0C80, 0x0CFF, 'kn'),
+        (0x0D00, 0x0D7F, 'ml'),
+        (0x0D80, 0x0DFF, 'si'),
+        (0x0E00, 0x0E7F, 'th'),
+        (0x0E80, 0x0EFF, 'lo'),
+        (0x1000, 0x109F, 'my'),
+        (0x10A0, 0x10FF, 'ka'),
+        (0x1100, 0x11FF, 'ko'),
+        (0x1200, 0x137F, 'am'),
+        (0x1780, 0x17FF, 'km'),
+        (0x3040, 0x30FF, 'ja'),
+        (0x3130, 0x318F, 'ko'),
+        (0x3400, 0x4DBF, 'zh'),
+        (0x4E00, 0x9FFF, 'zh'),
+        (0xAC00, 0xD7AF, 'ko'),
+    ]
+    SCRIPT_STARTS = [start for start, _, _ in SCRIPT_RANGES]
+
+    factory = None
+    factory_lock = Lock()
+
+    @classmethod
+    def load_factory(cls):
+        """Load the langdetect profiles once, with a fixed seed for deterministic results."""
+        with cls.factory_lock:
+            if cls.factory is None:
+                from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+
+                factory = DetectorFactory()
+                factory.load_profile(PROFILES_DIRECTORY)
+                factory.set_seed(Config.LANG_DETECT_SEED)
+                cls.factory = factory
+        return cls.factory
+
+    @classmethod
+    def detect_script(cls, text: str):
+        """
+        Detect the language from the Unicode script of the text.
+
+        Returns:
+            str: Language code, or None when the script is ambiguous
+        """
+        counts = {}
+        letters = 0
+        for ch in text:
+            if not ch.isalpha():
+                continue
+            letters += 1
+            code = ord(ch)
+            index = bisect_right(cls.SCRIPT_STARTS, code) - 1
+            if index >= 0 and code <= cls.SCRIPT_RANGES[index][1]:
+                language = cls.SCRIPT_RANGES[index][2]
+                counts[language] = counts.get(language, 0) + 1
+
+        # Kanji alongside kana is Japanese
+        if 'ja' in counts:
+            counts['ja'] += counts.pop('zh', 0)
+
+        if not counts:
+            return None
+        language, count = max(counts.items(), key=lambda item: item[1])
+        return language if count * 2 >= letters else None
+
+    @staticmethod
+    @lru_cache(maxsize=Config.LANG_DETECT_CACHE_SIZE)
+    def detect_sample(sample: str):
+        """Detect the language of a bounded text sample, memoizing recent results."""
+        language = LanguageDetector.detect_script(sample)
+        if language:
+            return language
+
+        from langdetect.lang_detect_exception import LangDetectException
+
+        detector = LanguageDetector.load_factory().create()
+        detector.append(sample)
+        try:
+            return detector.detect().lower()
+        except LangDetectException:
+            return None
+
+    @classmethod
+    def detect(cls, text: str):
+        """
+        Detect the language of text.
+
+        Only the first Config.LANG_DETECT_MAX_CHARS characters are examined.
+
+        Args:
+            text (str): Input text
+        Returns:
+            str: Lowercase language code, or None if it cannot be determined
+        """
+        return cls.detect_sample(text[:Config.LANG_DETECT_MAX_CHARS].strip())
 
 # ============================================================================
 # Voice Service
@@ -102,8 +874,50 @@ class DatabaseManager:
 class VoiceService:
     """Handle voice-related operations and validations."""
 
-    def __init__(self, voice_mappings):
-        self.voice_mappings = voice_mappings
+    def __init__(self, voice_mappings, source_path: str = None):
+        self.source_path = source_path
+        self.source_mtime = os.path.getmtime(source_path) if source_path else None
+        self.next_check = time.monotonic() + Config.VOICE_PACK_CHECK_INTERVAL
+        self.load(voice_mappings)
+
+    def load(self, voice_mappings):
+        """
+        Build the voice lookup index.
+
+        Voices are indexed under their full language code (e.g. 'en-us') and
+        its primary subtag (e.g. 'en'), each with and without gender, in
+        voice pack order so the first entry is the default voice.
+
+        Args:
+            voice_mappings (dict): Voice name to {'gender', 'language'} mapping
+        """
+        index = {}
+        for voice, data in voice_mappings.items():
+            language = data['language'].lower()
+            for prefix in dict.fromkeys([language, language.split('-')[0]]):
+                index.setdefault((prefix, None), []).append(voice)
+                index.setdefault((prefix, data['gender']), []).append(voice)
+
+        # Swap everything in at once so concurrent readers see a consistent view
+        self.voice_mappings, self.voice_index = voice_mappings, {
+            key: tuple(voices) for key, voices in index.items()
+        }
+
+    def reload_if_changed(self):
+        """Rebuild the index when the voice pack file has been modified."""
+        now = time.monotonic()
+        if not self.source_path or now < self.next_check:
+            return
+        self.next_check = now + Config.VOICE_PACK_CHECK_INTERVAL
+
+        try:
+            mtime = os.path.getmtime(self.source_path)
+            if mtime != self.source_mtime:
+                self.load(Config.load_voice_mappings())
+                self.source_mtime = mtime
+                logger.info(f"Reloaded voice pack: {self.source_path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reloading voice pack: {str(e)}")
 
     def get_available_voices(self, language: str, gender: str = None) -> list:
         """
@@ -115,51 +929,44 @@ class VoiceService:
         Returns:
             list: Available voice names
         """
-        available_voices = [
-            voice for voice, data in self.voice_mappings.items()
-            if data['language'].startswith(language)
-        ]
+        self.reload_if_changed()
+        return list(self.voice_index.get((language.lower(), gender), ()))
 
-        if gender:
-            available_voices = [
-                voice for voice in available_voices
-                if self.voice_mappings[voice]['gender'] == gender
-            ]
-
-        return available_voices
+    def get_default_voice(self, language: str, gender: str = None):
+        """Return the default voice for a language and gender, or None."""
+        voices = self.voice_index.get((language.lower(), gender))
+        return voices[0] if voices else None
 
     def validate_voice(self, voice: str) -> bool:
         """Check if a voice is valid."""
+        self.reload_if_changed()
         return voice in self.voice_mappings
 
-    def get_voice_for_text(self, text: str, requested_voice: str) -> str:
+    def get_voice_for_text(self, text: str, requested_voice: str, language: str = None) -> str:
         """
         Determine the most appropriate voice for the given text.
 
         Args:
             text (str): Input text
             requested_voice (str): Initially requested voice
+            language (str, optional): Language pinned by the client, skips detection
         Returns:
             str: Selected voice name
         """
-        detected_language = detect(text)
+        detected_language = language.lower() if language else LanguageDetector.detect(text)
         voice_data = self.voice_mappings[requested_voice]
+        voice_language = voice_data['language'].lower()
 
-        if detected_language.startswith(voice_data['language']):
+        if not detected_language or detected_language in (voice_language, voice_language.split('-')[0]):
             return requested_voice
 
-        # Try to find a voice with same gender and language
-        available_voices = self.get_available_voices(
-            detected_language,
-            voice_data['gender']
+        # Try a voice with same gender and language, then any voice with the language
+        voice = (
+            self.get_default_voice(detected_language, voice_data['gender'])
+            or self.get_default_voice(detected_language)
         )
-        if available_voices:
-            return available_voices[0]
-
-        # Try any voice with the correct language
-        available_voices = self.get_available_voices(detected_language)
-        if available_voices:
-            return available_voices[0]
+        if voice:
+            return voice
 
         raise ValueError("No suitable voice found for the detected language")
 
@@ -168,34 +975,274 @@ class VoiceService:
 # ============================================================================
 
 class CleanupService:
-    """Handle periodic cleanup of old audio files."""
+    """
+    Delete audio files when they expire.
 
-    @staticmethod
-    async def delete_expired_files():
-        """Delete files that have passed their expiration time."""
-        while True:
-            now = datetime.now()
-            with sqlite3.connect(Config.DATABASE_PATH) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT filename FROM files WHERE delete_at <= ?', (now,))
+    Expirations are kept in an in-memory min-heap, rebuilt from the database
+    at startup, and the cleanup thread sleeps until the earliest deadline.
+    When other processes schedule files too, the heap is also rebuilt on
+    every eviction pass to pick theirs up.
+    """
 
-                for (filename,) in cursor.fetchall():
-                    try:
-                        os.remove(os.path.join(Config.AUDIO_DIR, filename))
-                        cursor.execute('DELETE FROM files WHERE filename = ?', (filename,))
-                    except FileNotFoundError:
-                        logger.warning(f"File not found for deletion: {filename}")
+    expirations = []
+    condition = Condition()
+    eviction_requested = False
+    running = False
+    shared = False
+    files_deleted = 0
+    bytes_reclaimed = 0
+
+    @classmethod
+    def load(cls):
+        """Rebuild the expiration heap from the database."""
+        entries = [
+            (delete_at, filename)
+            for filename, delete_at in DatabaseManager.get_scheduled_files()
+        ]
+        heapq.heapify(entries)
+        with cls.condition:
+            cls.expirations = entries
+            cls.condition.notify()
+
+    @classmethod
+    def schedule(cls, file_id: str, filename: str, delete_at: datetime):
+        """Record a file for deletion at delete_at."""
+        DatabaseManager.add_file(file_id, filename, delete_at)
+        if not cls.running:
+            # Picked up from the database by the process running the service
+            return
+        with cls.condition:
+            heapq.heappush(cls.expirations, (delete_at, filename))
+            if cls.expirations[0][1] == filename:
+                cls.condition.notify()
 
-                conn.commit()
+    @classmethod
+    def request_eviction(cls):
+        """Wake the cleanup thread for a cache eviction pass."""
+        with cls.condition:
+            cls.eviction_requested = True
+            cls.condition.notify()
+
+    @classmethod
+    def take_due(cls, wake_by: float) -> list:
+        """
+        Wait until files are due and pop them, along with any due within the
+        grace period.
+
+        Args:
+            wake_by (float): time.monotonic() value at which to give up waiting
+        Returns:
+            list: Filenames to delete, empty if wake_by was reached or an
+                  eviction was requested first
+        """
+        with cls.condition:
+            while True:
+                cutoff = datetime.now() + timedelta(seconds=Config.CLEANUP_GRACE)
+                due = []
+                while cls.expirations and cls.expirations[0][0] <= cutoff:
+                    due.append(heapq.heappop(cls.expirations)[1])
+                if due:
+                    return due
+                if cls.eviction_requested:
+                    return []
 
-            await asyncio.sleep(60)
+                timeout = wake_by - time.monotonic()
+                if timeout <= 0:
+                    return []
+                if cls.expirations:
+                    timeout = min(timeout, (cls.expirations[0][0] - datetime.now()).total_seconds())
+                cls.condition.wait(max(timeout, 0))
 
     @classmethod
-    def start(cls):
-        """Start the cleanup service in a background thread."""
-        thread = Thread(target=lambda: asyncio.run(cls.delete_expired_files()))
+    def delete_files(cls, filenames: list) -> int:
+        """
+        Unlink files and remove their records.
+
+        Returns:
+            int: Bytes reclaimed
+        """
+        reclaimed = 0
+        for filename in filenames:
+            path = os.path.join(Config.AUDIO_DIR, filename)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                reclaimed += size
+            except FileNotFoundError:
+                logger.warning(f"File not found for deletion: {filename}")
+        DatabaseManager.remove_files(filenames)
+
+        cls.files_deleted += len(filenames)
+        cls.bytes_reclaimed += reclaimed
+        logger.info(
+            f"Deleted {len(filenames)} expired audio files, reclaimed {reclaimed} bytes "
+            f"({cls.bytes_reclaimed} bytes total)"
+        )
+        return reclaimed
+
+    @classmethod
+    def run(cls):
+        """Delete expired files as they come due and periodically evict the cache."""
+        next_eviction = time.monotonic()
+        while True:
+            if time.monotonic() >= next_eviction or cls.eviction_requested:
+                with cls.condition:
+                    cls.eviction_requested = False
+                if cls.shared:
+                    try:
+                        DatabaseManager.flush()
+                        cls.load()
+                    except Exception as e:
+                        logger.error(f"Error loading scheduled files: {str(e)}")
+                if Config.CACHE_ENABLED:
+                    try:
+                        SpeechCache.evict()
+                    except Exception as e:
+                        logger.error(f"Error evicting cache: {str(e)}")
+                next_eviction = time.monotonic() + Config.CACHE_EVICT_INTERVAL
+
+            due = cls.take_due(next_eviction)
+            if due:
+                try:
+                    cls.delete_files(due)
+                except Exception as e:
+                    logger.error(f"Error deleting expired files: {str(e)}")
+
+    @classmethod
+    def start(cls, shared: bool = False):
+        """
+        Start the cleanup service in a background thread.
+
+        Args:
+            shared (bool): Whether other processes, such as uvicorn workers,
+                           schedule files in the same database
+        """
+        cls.shared = shared
+        cls.running = True
+        cls.load()
+        thread = Thread(target=cls.run)
         thread.daemon = True
         thread.start()
+# ============================================================================
+# Speech Service
+# ============================================================================
+
+class SpeechRequestError(Exception):
+    """Raised for an invalid /v1/audio/speech request."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class SpeechService:
+    """Resolve /v1/audio/speech requests independently of the serving framework."""
+
+    VALID_SPEEDS = {
+        "normal": None,
+        "slow": "-8%",
+        "fast": "+12%"
+    }
+
+    def __init__(self, voice_service: VoiceService):
+        self.voice_service = voice_service
+
+    def prepare(self, data) -> dict:
+        """
+        Validate a request body and decide how to fulfil it.
+
+        Args:
+            data (dict): Parsed JSON request body
+        Returns:
+            dict: Synthesis plan with the resolved voice, rate, cache state
+                  and output file
+        Raises:
+            SpeechRequestError: If the request is invalid
+        """
+        if not isinstance(data, dict):
+            raise SpeechRequestError("Invalid request body")
+
+        text = data.get('input', '').replace("*", "")
+        voice = data.get("model")
+        speed = data.get('voice')
+
+        # Validate input
+        if not text:
+            raise SpeechRequestError("No text provided")
+        if not voice:
+            raise SpeechRequestError("No voice provided")
+        if not self.voice_service.validate_voice(voice):
+            raise SpeechRequestError("Invalid voice provided")
+        if speed not in self.VALID_SPEEDS:
+            raise SpeechRequestError("Invalid rate. Use 'normal', 'slow', or 'fast'", 404)
+
+        response_format = str(data.get('response_format') or Config.DEFAULT_RESPONSE_FORMAT).lower()
+        audio_format = AudioFormats.get(response_format)
+        if not audio_format:
+            raise SpeechRequestError(
+                f"Invalid response_format. Use one of: {', '.join(AudioFormats.FORMATS)}"
+            )
+        if AudioFormats.needs_transcoding(response_format) and not AudioFormats.ffmpeg_available():
+            raise SpeechRequestError(f"response_format '{response_format}' requires ffmpeg on the server")
+
+        language = data.get('language')
+        if language is not None and (not isinstance(language, str) or not language.strip()):
+            raise SpeechRequestError("Invalid language. Use a language code such as 'en' or 'fr'")
+
+        # Get appropriate voice and speech settings
+        try:
+            voice = self.voice_service.get_voice_for_text(text, voice, language and language.strip())
+        except ValueError as e:
+            raise SpeechRequestError(str(e))
+        rate = self.VALID_SPEEDS[speed]
+
+        # Serve identical requests from the cache
+        cache_key = None
+        cached_path = None
+        if Config.CACHE_ENABLED:
+            cache_key = SpeechCache.make_key(text, voice, rate, response_format)
+            cached_path = SpeechCache.lookup(cache_key)
+
+        # Generate filename, content-addressed when caching
+        mimetype, extension, _ = audio_format
+        file_id = cache_key or str(uuid.uuid4())
+        output_file = f'{file_id}.{extension}'
+        stream = bool(data.get('stream', Config.STREAM_RESPONSES))
+
+        return {
+            'text': text,
+            'voice': voice,
+            'rate': rate,
+            'response_format': response_format,
+            'mimetype': mimetype,
+            'stream': stream,
+            'cache_key': cache_key,
+            'cached_path': cached_path,
+            'file_id': file_id,
+            'output_file': output_file,
+            # Audio is only written to disk when it is being cached, or
+            # when saved responses are not kept in memory
+            'output_path': (
+                os.path.join(Config.AUDIO_DIR, output_file)
+                if cache_key or not (stream or Config.DISKLESS) else None
+            )
+        }
+
+    @staticmethod
+    def finish(plan: dict):
+        """Register the written output file with the cache or the cleanup service."""
+        if plan['cache_key']:
+            SpeechCache.store(plan['cache_key'], plan['output_file'])
+        elif plan['output_path']:
+            # Record file for cleanup
+            delete_at = datetime.now() + timedelta(minutes=3)
+            CleanupService.schedule(plan['file_id'], plan['output_file'], delete_at)
+
+# ============================================================================
+# Flask Application
+# ============================================================================
+
 def create_app():
     """Create and configure the Flask application."""
     app = Flask(__name__)
@@ -207,59 +1254,50 @@ def create_app():
 
     # Initialize services
     Config.init_directories()
-    voice_service = VoiceService(Config.load_voice_mappings())
-    
+    voice_service = VoiceService(Config.load_voice_mappings(), Config.VOICE_PACK_PATH)
+    speech_service = SpeechService(voice_service)
+    app.extensions['speech_service'] = speech_service
+    LanguageDetector.load_factory()
+
 
     @app.route('/v1/audio/speech', methods=['POST'])
     async def convert_text_to_speech():
         """Convert text to speech using Edge TTS."""
-        data = request.get_json()
-        text = data.get('input', '').replace("*", "")
-        voice = data.get("model")
-        speed = data.get('voice')
+        try:
+            plan = speech_service.prepare(request.get_json(silent=True))
 
-        # Validate input
-        if not text:
-            return jsonify(error="No text provided"), 400
-        if not voice:
-            return jsonify(error="No voice provided"), 400
-        if not voice_service.validate_voice(voice):
-            return jsonify(error="Invalid voice provided"), 400
+            if plan['cached_path']:
+                return send_file(plan['cached_path'], mimetype=plan['mimetype'], as_attachment=True)
 
-        try:
-            # Get appropriate voice
-            voice = voice_service.get_voice_for_text(text, voice)
-
-            # Generate unique filename
-            unique_id = str(uuid.uuid4())
-            output_file = f'{unique_id}.wav'
-            output_path = os.path.join(Config.AUDIO_DIR, output_file)
-
-            # Configure speech settings
-            valid_speeds = {
-                "normal": None,
-                "slow": "-8%",
-                "fast": "+12%"
-            }
-
-            rate = valid_speeds.get(speed)
-            if speed not in valid_speeds:
-                abort(404, description="Invalid rate. Use 'normal', 'slow', or 'fast'")
-
-            # Generate speech
-            communicate = edge_tts.Communicate(
-                text,
-                voice=voice,
-                rate=rate if rate is not None else None
-            )
-            await communicate.save(output_path)
+            # Stream audio to the client as it is generated
+            if plan['stream']:
+                audio = SpeechSynthesizer.iter_audio(
+                    plan['text'],
+                    plan['voice'],
+                    plan['rate'],
+                    output_path=plan['output_path'],
+                    on_complete=lambda: speech_service.finish(plan),
+                    response_format=plan['response_format']
+                )
+                # Wait for the first chunk so synthesis errors still return 500
+                first_chunk = next(audio, b'')
+                return Response(chain([first_chunk], audio), mimetype=plan['mimetype'])
 
-            # Record file for cleanup
-            delete_at = datetime.now() + timedelta(minutes=3)
-            DatabaseManager.add_file(unique_id, output_file, delete_at)
+            # Generate speech and serve it from memory
+            audio = await SpeechSynthesizer.synthesize(
+                plan['text'], plan['voice'], plan['rate'], plan['output_path'], plan['response_format']
+            )
+            speech_service.finish(plan)
 
-            return send_file(output_path, as_attachment=True)
+            return send_file(
+                io.BytesIO(audio),
+                mimetype=plan['mimetype'],
+                as_attachment=True,
+                download_name=plan['output_file']
+            )
 
+        except SpeechRequestError as e:
+            return jsonify(error=e.message), e.status
         except Exception as e:
             logger.error(f"Error processing request: {str(e)}")
             abort(500, description=f"Error processing request: {str(e)}")
@@ -277,7 +1315,8 @@ def create_app():
     def get_available_voices():
         """Return list of all available voices and their details"""
         try:
-            voices = Config.load_voice_mappings()
+            voice_service.reload_if_changed()
+            voices = voice_service.voice_mappings
             # Group voices by language with better structure
             languages = {}
             for voice_id, details in voices.items():
@@ -321,4 +1360,197 @@ def create_app():
     return app
 
 
+# ============================================================================
+# ASGI Serving
+# ============================================================================
+
+async def send_response(send, status: int, body: bytes, headers: list):
+    """Send a complete ASGI HTTP response."""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'access-control-allow-origin', b'*')] + headers
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, status: int, payload: dict):
+    """Send a JSON ASGI response."""
+    await send_response(send, status, json.dumps(payload).encode('utf-8'), [
+        (b'content-type', b'application/json')
+    ])
+
+
+async def send_audio(send, body: bytes, filename: str, mimetype: str):
+    """Send audio as an attachment, like Flask's send_file."""
+    await send_response(send, 200, body, [
+        (b'content-type', mimetype.encode('latin-1')),
+        (b'content-disposition', f'attachment; filename={filename}'.encode('latin-1'))
+    ])
+
+
+async def send_audio_file(send, path: str, mimetype: str):
+    """Send an audio file as an attachment."""
+    with open(path, 'rb') as f:
+        body = await asyncio.to_thread(f.read)
+    await send_audio(send, body, os.path.basename(path), mimetype)
+
+
+def create_asgi_app(flask_app: Flask = None):
+    """
+    Create an ASGI application for the TTS server.
+
+    POST /v1/audio/speech is served natively on the shared event loop, with
+    at most Config.MAX_CONCURRENT_SYNTHESES syntheses in flight. Every other
+    route is passed through to the Flask application.
+
+    Args:
+        flask_app (Flask, optional): Application to wrap. When omitted, as in
+            uvicorn worker processes, a new one is created along with its
+            database writer. Cleanup is left to the process serving them.
+    Returns:
+        callable: ASGI application
+    """
+    if flask_app is None:
+        flask_app = create_app()
+        DatabaseManager.init_db()
+
+    speech_service = flask_app.extensions['speech_service']
+    fallback = WsgiToAsgi(flask_app)
+    limiter = None
+
+    async def convert_text_to_speech(receive, send):
+        nonlocal limiter
+        if limiter is None:
+            limiter = asyncio.Semaphore(Config.MAX_CONCURRENT_SYNTHESES)
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        try:
+            data = json.loads(body) if body else None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # Same as Flask's get_json(silent=True); prepare rejects it
+            data = None
+
+        try:
+            plan = await asyncio.to_thread(speech_service.prepare, data)
+        except SpeechRequestError as e:
+            return await send_json(send, e.status, {'error': e.message})
+        except Exception as e:
+            logger.error(f"Error processing request: {str(e)}")
+            return await send_json(send, 500, {'message': f"Error processing request: {str(e)}"})
+
+        if plan['cached_path']:
+            return await send_audio_file(send, plan['cached_path'], plan['mimetype'])
+
+        async with limiter:
+            audio = SpeechSynthesizer.stream_to_file(
+                plan['text'], plan['voice'], plan['rate'], plan['output_path'], plan['response_format']
+            )
+            try:
+                if not plan['stream']:
+                    body = b''.join([data async for data in audio])
+                    await asyncio.to_thread(speech_service.finish, plan)
+                    return await send_audio(send, body, plan['output_file'], plan['mimetype'])
+
+                # Wait for the first chunk so synthesis errors still return 500
+                first_chunk = await anext(audio, b'')
+            except Exception as e:
+                logger.error(f"Error processing request: {str(e)}")
+                return await send_json(send, 500, {'message': f"Error processing request: {str(e)}"})
+
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'access-control-allow-origin', b'*'),
+                    (b'content-type', plan['mimetype'].encode('latin-1'))
+                ]
+            })
+            completed = False
+            try:
+                await send({'type': 'http.response.body', 'body': first_chunk, 'more_body': True})
+                async for data in audio:
+                    await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+                completed = True
+            except Exception as e:
+                logger.error(f"Error streaming speech: {str(e)}")
+            finally:
+                await audio.aclose()
+            await send({'type': 'http.response.body', 'body': b''})
+
+        if completed:
+            await asyncio.to_thread(speech_service.finish, plan)
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        if (scope['type'] == 'http' and scope['method'] == 'POST'
+                and scope['path'] == '/v1/audio/speech'):
+            return await convert_text_to_speech(receive, send)
+
+        await fallback(scope, receive, send)
+
+    return app
+
+
+def serve_asgi(flask_app: Flask, port: int, host: str = "0.0.0.0"):
+    """
+    Serve the TTS application with uvicorn.
+
+    With Config.ASGI_WORKERS above one, uvicorn runs that many worker
+    processes, each creating its own application through create_asgi_app.
+    Cleanup then runs once, in this process, rather than in every worker.
+    """
+    import uvicorn
+
+    if Config.ASGI_WORKERS > 1:
+        uvicorn.run(
+            'tts:create_asgi_app',
+            factory=True,
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+            host=host,
+            port=port,
+            workers=Config.ASGI_WORKERS,
+            limit_concurrency=Config.ASGI_LIMIT_CONCURRENCY
+        )
+        return
+
+    server = uvicorn.Server(uvicorn.Config(
+        create_asgi_app(flask_app),
+        host=host,
+        port=port,
+        limit_concurrency=Config.ASGI_LIMIT_CONCURRENCY
+    ))
+    server.run()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the TTS server.")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=3400)
+    args = parser.parse_args()
+
+    app = create_app()
+    # Uvicorn workers share the files, so only this process cleans them up
+    DatabaseManager.init_db()
+    CleanupService.start(shared=Config.SERVE_MODE == "asgi" and Config.ASGI_WORKERS > 1)
 
+    if Config.SERVE_MODE == "asgi":
+        serve_asgi(app, port=args.port, host=args.host)
+    else:
+        app.run(port=args.port, host=args.host)
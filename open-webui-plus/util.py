@@ -5,6 +5,7 @@ import subprocess
 import threading
 import re
 import time
+import queue
 
 
 # Initialize colorama
@@ -84,7 +85,72 @@ def tost(text, color="default"):
 
 
 
-def monitor_output(pipe , message , path):
+class TunnelRegistry:
+    """
+    Thread-safe registry of the current tunnel URL of each server.
+
+    URLs are kept in memory for the web handlers. When a URL changes it is
+    also written to its access file, on a background thread, so the files
+    stay available to anything outside this process.
+    """
+
+    def __init__(self):
+        self.tunnels = {}
+        self.lock = threading.Condition()
+        self.writes = queue.Queue()
+        self.writer = None
+
+    def set(self, name, url, path=None):
+        """Record a tunnel URL, persisting it only if it changed"""
+        with self.lock:
+            tunnel = self.tunnels.get(name)
+            if tunnel and tunnel["url"] == url:
+                return False
+            self.tunnels[name] = {"url": url, "path": path, "updated_at": time.time()}
+            self.lock.notify_all()
+            if path:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self.run_writer, daemon=True)
+                    self.writer.start()
+                self.writes.put((path, url))
+        return True
+
+    def get(self, name, default=None):
+        """Return the URL of a tunnel, or default if it isn't up yet"""
+        with self.lock:
+            tunnel = self.tunnels.get(name)
+            return tunnel["url"] if tunnel else default
+
+    def wait(self, name, timeout=None):
+        """Wait until a tunnel has a URL and return it, or None on timeout"""
+        with self.lock:
+            self.lock.wait_for(lambda: name in self.tunnels, timeout)
+            tunnel = self.tunnels.get(name)
+            return tunnel["url"] if tunnel else None
+
+    def snapshot(self):
+        """Return every tunnel's URL and when it was last updated"""
+        with self.lock:
+            return {
+                name: {"url": tunnel["url"], "updated_at": tunnel["updated_at"]}
+                for name, tunnel in self.tunnels.items()
+            }
+
+    def run_writer(self):
+        while True:
+            path, url = self.writes.get()
+            try:
+                temp_path = f"{path}.part"
+                with open(temp_path, "w") as ms:
+                    ms.write(url)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logging.error(f"Failed to write tunnel URL to '{path}'. Error: {e}")
+
+
+tunnel_registry = TunnelRegistry()
+
+def monitor_output(pipe , message , path, name=None):
     """Monitor the process output for the Cloudflare URL"""
     while True:
         line = pipe.readline()
@@ -92,20 +158,17 @@ def monitor_output(pipe , message , path):
             break
         # Look for trycloudflare.com URL in the output
         url_match = re.search(r'https?://[a-zA-Z0-9-]+\.trycloudflare\.com', line.decode('utf-8', errors='ignore'))
-        if url_match:
+        if url_match and tunnel_registry.set(name or path, url_match.group(0), path):
             print(f"{Fore.MAGENTA}""="*80)
             print(f"{Fore.GREEN}\n{message} : {url_match.group(0)}\n{Fore.GREEN}")
-            with open(path , "w") as ms:
-              ms.write(url_match.group(0))
             print(f"{Fore.MAGENTA}""="*45)
 
-def run_cloudflare(port , message , path):
-    # Command to run cloudflared tunnel
+def cloudflare_command(port):
+    """Build the cloudflared command for a quick tunnel to a local port"""
     with open(os.path.join(os.getcwd() , "access" , "cloudflare.txt") , "r") as cl:
         driver = os.path.join(os.getcwd() , cl.read())
-    cl.close()
     print(driver)
-    command = [
+    return [
         f'{driver}',
         'tunnel',
         '--url',
@@ -114,30 +177,25 @@ def run_cloudflare(port , message , path):
         'http2'
     ]
 
+def watch_tunnel(process, message, path, name=None):
+    """Start threads that pick the tunnel URL out of cloudflared's output"""
+    # Start monitoring threads for both stdout and stderr
+    for pipe in (process.stdout, process.stderr):
+        thread = threading.Thread(
+            target=monitor_output,
+            args=(pipe, message, path, name)
+        )
+        thread.daemon = True
+        thread.start()
+
+def run_cloudflare(port , message , path, name=None):
     # Start the process in background
     process = subprocess.Popen(
-        command,
+        cloudflare_command(port),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE
     )
-
-    # Start monitoring threads for both stdout and stderr
-    stdout_thread = threading.Thread(
-        target=monitor_output, 
-        args=(process.stdout, message, path)
-    )
-    stderr_thread = threading.Thread(
-        target=monitor_output, 
-        args=(process.stderr, message, path)
-    )
-
-
-    stdout_thread.daemon = True
-    stderr_thread.daemon = True
-
-    stdout_thread.start()
-    stderr_thread.start()
-
+    watch_tunnel(process, message, path, name)
     return process
 
 def get_content(path):